@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import html_parser  # noqa: E402
+from book_info import (  # noqa: E402
+    _extract_product_fields, _get_additional_info, _get_author, _get_category_tree, _get_detail_info
+)
+from book_searcher import AsyncBookSearcher  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+EXPECTED_PATH = os.path.join(FIXTURES_DIR, "expected.json")
+
+searcher = AsyncBookSearcher()
+
+
+def _rank_area(html):
+    return html_parser.make_soup(html).select_one("div.mod.type02_m035.clearfix ul")
+
+
+# 每個擷取函式：(適用的頁面類型, 由原始 HTML 準備輸入, 擷取函式)
+# 商品頁擷取函式的輸入是已解析好的 soup，只計算擷取本身；搜尋頁函式直接吃原始 HTML，包含解析成本
+EXTRACTORS = {
+    "_get_author": ("product", html_parser.make_soup, _get_author),
+    "_get_detail_info": ("product", html_parser.make_soup, _get_detail_info),
+    "_get_category_tree": ("product", html_parser.make_soup, _get_category_tree),
+    "_get_additional_info": ("product", html_parser.make_soup, _get_additional_info),
+    "_extract_product_fields": ("product", html_parser.make_soup, _extract_product_fields),
+    "parse_book_data": ("search", str, searcher.parse_book_data),
+    "get_search_stats": ("search", str, searcher.get_search_stats),
+    "parse_book_rank": ("rank", _rank_area, searcher.parse_book_rank),
+}
+
+
+def load_fixtures():
+    fixtures = {}
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if name.endswith(".html"):
+            with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+                fixtures[name] = f.read()
+    return fixtures
+
+
+def cases(fixtures, only=None):
+    for extractor, (kind, prepare, func) in EXTRACTORS.items():
+        if only and extractor not in only:
+            continue
+        for name, html in fixtures.items():
+            if name.split("_", 1)[0] == kind:
+                yield extractor, name, func, prepare(html)
+
+
+def normalize(value):
+    # tuple 與 list 視為相同，與 expected.json 的 JSON 形式比對
+    return json.loads(json.dumps(value, ensure_ascii=False))
+
+
+def collect_outputs(fixtures):
+    outputs = {}
+    for extractor, name, func, arg in cases(fixtures):
+        outputs.setdefault(name, {})[extractor] = normalize(func(arg))
+    return outputs
+
+
+def check_expected(fixtures):
+    # 擷取結果必須與 expected.json 完全相同，避免加速時不小心改壞擷取邏輯
+    with open(EXPECTED_PATH, encoding="utf-8") as f:
+        expected = json.load(f)
+    outputs = collect_outputs(fixtures)
+    failures = []
+    for name, results in outputs.items():
+        for extractor, output in results.items():
+            if expected.get(name, {}).get(extractor) != output:
+                failures.append(f"{name} / {extractor}")
+    assert not failures, "擷取結果與 expected.json 不同：\n  " + "\n  ".join(failures)
+    print(f"✅ {sum(len(r) for r in outputs.values())} 組擷取結果與 expected.json 一致")
+
+
+def update_expected(fixtures):
+    with open(EXPECTED_PATH, "w", encoding="utf-8") as f:
+        json.dump(collect_outputs(fixtures), f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"已更新 {EXPECTED_PATH}")
+
+
+def measure_allocations(func, arg):
+    # 單次呼叫期間的記憶體配置：峰值與呼叫結束後仍保留的量（KiB）
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = func(arg)
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return (peak - before) / 1024, (after - before) / 1024
+
+
+def bench(fixtures, rounds, only=None):
+    print(f"{'extractor':<22}{'page':<26}{'pages/sec':>12}{'ms/page':>10}{'peak KiB':>11}{'kept KiB':>10}")
+    for extractor, name, func, arg in cases(fixtures, only):
+        func(arg)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            func(arg)
+        elapsed = time.perf_counter() - start
+        peak, kept = measure_allocations(func, arg)
+        print(f"{extractor:<22}{name:<26}{rounds / elapsed:>12.1f}{elapsed / rounds * 1000:>10.3f}"
+              f"{peak:>11.1f}{kept:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="逐一測量各擷取函式的吞吐量與記憶體配置，並驗證擷取結果")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--engine", choices=html_parser.PARSER_ENGINES, default=None)
+    parser.add_argument("--only", nargs="*", choices=list(EXTRACTORS), help="只測量指定的擷取函式")
+    parser.add_argument("--update-expected", action="store_true", help="以目前的擷取結果覆寫 expected.json")
+    args = parser.parse_args()
+
+    if args.engine:
+        html_parser.set_engine(args.engine)
+    fixtures = load_fixtures()
+    if args.update_expected:
+        update_expected(fixtures)
+    check_expected(fixtures)
+    bench(fixtures, args.rounds, args.only)
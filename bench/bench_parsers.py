@@ -0,0 +1,84 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import html_parser  # noqa: E402
+from book_info import _parse_product_page  # noqa: E402
+from book_searcher import AsyncBookSearcher  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+searcher = AsyncBookSearcher()
+
+# 依頁面類型（檔名前綴）對應整頁解析函式
+PAGE_PARSERS = {
+    "product": _parse_product_page,
+    "search": lambda html: (searcher.get_search_stats(html), searcher.parse_book_data(html)),
+    "rank": searcher.parse_rank_page,
+}
+
+
+def load_fixtures():
+    fixtures = {}
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if name.endswith(".html"):
+            with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+                fixtures[name] = f.read()
+    return fixtures
+
+
+def page_type(name):
+    return name.split("_", 1)[0]
+
+
+def available_engines():
+    engines = []
+    for engine in html_parser.PARSER_ENGINES:
+        try:
+            html_parser.set_engine(engine)
+        except ValueError:
+            continue
+        engines.append(engine)
+    return engines
+
+
+def check_engines_agree(fixtures, engines):
+    # 各引擎對同一份語料必須擷取出完全相同的結果
+    for name, html in fixtures.items():
+        parse = PAGE_PARSERS[page_type(name)]
+        outputs = {}
+        for engine in engines:
+            html_parser.set_engine(engine)
+            outputs[engine] = parse(html)
+        baseline = outputs[engines[0]]
+        for engine in engines[1:]:
+            assert outputs[engine] == baseline, f"{name}: {engine} 與 {engines[0]} 的擷取結果不同"
+    print(f"✅ {len(fixtures)} 個頁面在 {', '.join(engines)} 下擷取結果一致")
+
+
+def bench(fixtures, engines, rounds):
+    print(f"{'page':<24}{'engine':<14}{'pages/sec':>12}{'ms/page':>10}")
+    for name, html in fixtures.items():
+        parse = PAGE_PARSERS[page_type(name)]
+        for engine in engines:
+            html_parser.set_engine(engine)
+            parse(html)
+            start = time.perf_counter()
+            for _ in range(rounds):
+                parse(html)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<24}{engine:<14}{rounds / elapsed:>12.1f}{elapsed / rounds * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比較各 HTML 解析引擎的擷取吞吐量")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    engines = available_engines()
+    check_engines_agree(fixtures, engines)
+    bench(fixtures, engines, args.rounds)
@@ -0,0 +1,63 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import html_parser  # noqa: E402
+from book_info import (  # noqa: E402
+    _extract_product_fields, _get_additional_info, _get_author, _get_category_tree, _get_detail_info,
+    _get_image_url, _get_price, _get_title
+)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def extract_multipass(soup):
+    # 原本的作法：每個 _get_* 各自從頭搜尋整份文件
+    detail_info = _get_detail_info(soup)
+    isbn = detail_info.pop("ISBN", "")
+    return {
+        "ISBN": isbn,
+        "image": _get_image_url(soup),
+        "title": _get_title(soup),
+        "price": _get_price(soup),
+        **_get_author(soup),
+        "category_trees": _get_category_tree(soup),
+        "detail_info": detail_info,
+        "additional_info": _get_additional_info(soup)
+    }
+
+
+def measure(func, soup, rounds):
+    func(soup)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(soup)
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main(rounds):
+    # 兩種作法都使用同一份已解析的 soup，只比較擷取本身
+    print(f"{'page':<26}{'multi-pass ms':>15}{'single-pass ms':>16}{'speedup':>10}")
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if not (name.startswith("product_") and name.endswith(".html")):
+            continue
+        with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+            soup = html_parser.make_soup(f.read())
+        assert _extract_product_fields(soup) == extract_multipass(soup), f"{name} 兩種擷取結果不同"
+        multi = measure(extract_multipass, soup, rounds)
+        single = measure(_extract_product_fields, soup, rounds)
+        print(f"{name:<26}{multi:>15.3f}{single:>16.3f}{multi / single:>9.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比較商品頁單次走訪擷取與逐欄位搜尋整份文件的耗時")
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--engine", choices=html_parser.PARSER_ENGINES, default=None)
+    args = parser.parse_args()
+
+    if args.engine:
+        html_parser.set_engine(args.engine)
+    main(args.rounds)
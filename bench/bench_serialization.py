@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic import TypeAdapter  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+from book_info import _parse_product_page  # noqa: E402
+from book_model import BookInfo, BookIntroduce, BookRankResponse, BookSearchCriteria, BookSearchResponse, \
+    BookSearchResultItem, BookStats  # noqa: E402
+from book_searcher import AsyncBookSearcher  # noqa: E402
+from json_response import FastJSONResponse, orjson  # noqa: E402
+from main import BOOK_INFO_FIELDS, _format_search_book, _project  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+searcher = AsyncBookSearcher()
+
+
+def load(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def fastapi_render(model_cls, value):
+    # 模擬 FastAPI 處理回傳的 Pydantic 物件：依 response_model 再驗證一次、轉成 JSON 相容 dict，再由 JSONResponse 編碼
+    adapter = TypeAdapter(model_cls)
+    validated = adapter.validate_python(value, from_attributes=True)
+    return JSONResponse(adapter.dump_python(validated, mode="json")).body
+
+
+def build_cases():
+    page = _parse_product_page(load("product_full.html"))
+    info = {key: value for key, value in page.items() if key != "additional_info"}
+    introduce = {"title": page["title"], **page["additional_info"]}
+    (total_items, total_pages), books = searcher.parse_search_page(load("search_python.html"))
+    criteria = {
+        "keyword": "python", "author": None, "publisher": None, "in_stock_only": True,
+        "price_range": {"min": 0, "max": 999999}, "date_after": None
+    }
+    stats = {"total_items": total_items, "total_pages": total_pages}
+    rank = searcher.parse_rank_page(load("rank_saletop.html"))
+
+    # 每個端點：(改版前的回應路徑, 改版後的回應路徑)
+    return {
+        "/api/book/{pd_id}": (
+            lambda: fastapi_render(BookInfo, BookInfo(**info)),
+            lambda: FastJSONResponse(_project(info, BOOK_INFO_FIELDS)).body,
+        ),
+        "/api/book/introduce/{pd_id}": (
+            lambda: fastapi_render(BookIntroduce, BookIntroduce(**json.loads(
+                json.dumps(introduce, ensure_ascii=False, indent=4)))),
+            lambda: FastJSONResponse({"title": introduce["title"], "內容簡介": introduce["內容簡介"]}).body,
+        ),
+        "/api/books/search": (
+            lambda: fastapi_render(BookSearchResponse, BookSearchResponse(
+                search_criteria=BookSearchCriteria(**criteria),
+                stats=BookStats(**stats),
+                books=[BookSearchResultItem(**_format_search_book(book, True)) for book in books],
+                next_cursor=None
+            )),
+            lambda: FastJSONResponse({
+                "search_criteria": criteria,
+                "stats": stats,
+                "books": [_format_search_book(book, True) for book in books],
+                "next_cursor": None
+            }).body,
+        ),
+        "/api/books/rank": (
+            lambda: fastapi_render(BookRankResponse, BookRankResponse(root=rank)),
+            lambda: FastJSONResponse({"root": rank}).body,
+        ),
+    }
+
+
+def timed(func, rounds):
+    func()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def bench(cases, rounds):
+    print(f"{'endpoint':<30}{'before µs':>12}{'after µs':>12}{'speedup':>10}")
+    for endpoint, (before, after) in cases.items():
+        assert json.loads(before()) == json.loads(after()), f"{endpoint}: 改版前後的回應內容不同"
+        before_us = timed(before, rounds)
+        after_us = timed(after, rounds)
+        print(f"{endpoint:<30}{before_us:>12.1f}{after_us:>12.1f}{before_us / after_us:>9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比較各端點改版前後的回應序列化成本")
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"JSON 編碼器：{'orjson' if orjson is not None else 'json（未安裝 orjson）'}")
+    bench(build_cases(), args.rounds)
@@ -1,14 +1,19 @@
-import httpx
-from bs4 import BeautifulSoup
-import json
+from bs4 import BeautifulSoup, Tag
 import re
 import asyncio
 from typing import Dict, Optional
+from page_store import fetch_page, is_stale_fallback, PAGE_STORE_PRODUCT_MAX_AGE
+from rate_limit import UpstreamUnavailable
+from singleflight import upstream_flight
+from cache import product_page_cache
+from html_parser import make_soup
+from parse_executor import run_parse
+from metrics import timed_extractor
+from shared_cache import shared_load
 
-def _get_category_tree(soup: BeautifulSoup) -> list:
+def _category_tree_from(sort_items) -> list:
     categories = []
-    sort_lists = soup.select(".bd > .sort > li")
-    for sort_list in sort_lists:
+    for sort_list in sort_items:
         category_tags = sort_list.select("a")
         if category_tags:
             current_node = {"name": category_tags[0].get_text(strip=True), "children": []}
@@ -21,15 +26,25 @@ def _get_category_tree(soup: BeautifulSoup) -> list:
             categories.append(current_node)
     return categories if categories else [{"name": None, "children": []}]
 
-def _get_image_url(soup: BeautifulSoup) -> str:
-    img_tag = soup.find("img", class_="cover")
+@timed_extractor
+def _get_category_tree(soup: BeautifulSoup) -> list:
+    return _category_tree_from(soup.select(".bd > .sort > li"))
+
+def _image_url_from(img_tag) -> str:
     return img_tag.get("src") if img_tag else ""
 
-def _get_title(soup: BeautifulSoup) -> str:
-    title_tag = soup.find("div", class_="mod type02_p002 clearfix")
+@timed_extractor
+def _get_image_url(soup: BeautifulSoup) -> str:
+    return _image_url_from(soup.find("img", class_="cover"))
+
+def _title_from(title_tag) -> str:
     return title_tag.get_text(strip=True) if title_tag else ""
 
-def _get_author(soup: BeautifulSoup) -> Dict[str, Optional[str]]:
+@timed_extractor
+def _get_title(soup: BeautifulSoup) -> str:
+    return _title_from(soup.find("div", class_="mod type02_p002 clearfix"))
+
+def _author_from(author_section) -> Dict[str, Optional[str]]:
     author_info = {
         "authors": [],
         "original_authors": [],
@@ -40,7 +55,6 @@ def _get_author(soup: BeautifulSoup) -> Dict[str, Optional[str]]:
     }
 
     #  HTML 結構(作者)是否存在檢查
-    author_section = soup.find("div", class_="type02_p003 clearfix")
     if not author_section:
         print("⚠️ 找不到作者資訊區塊 (type02_p003 clearfix)，跳過作者解析")
         return author_info
@@ -71,22 +85,28 @@ def _get_author(soup: BeautifulSoup) -> Dict[str, Optional[str]]:
         elif "語言：" in text:
             author_info["language"] = text.split("語言：", 1)[1].strip()
 
+    # 去除重複但保留頁面上的順序，讓輸出穩定可比對
     for key in ["authors", "original_authors", "translators"]:
-        author_info[key] = list(filter(None, set(author_info[key])))
+        author_info[key] = list(dict.fromkeys(filter(None, author_info[key])))
 
     return author_info
 
+@timed_extractor
+def _get_author(soup: BeautifulSoup) -> Dict[str, Optional[str]]:
+    return _author_from(soup.find("div", class_="type02_p003 clearfix"))
 
-def _get_price(soup: BeautifulSoup) -> int:
-    price_tag = soup.select_one(".price > li:nth-child(1) > em:nth-child(1)")
+def _price_from(price_tag) -> int:
     if price_tag:
         price_text = price_tag.get_text(strip=True).replace(',', '')
         return int(price_text) if price_text.isdigit() else 0
     return 0
 
-def _get_additional_info(soup: BeautifulSoup) -> Dict[str, str]:
+@timed_extractor
+def _get_price(soup: BeautifulSoup) -> int:
+    return _price_from(soup.select_one(".price > li:nth-child(1) > em:nth-child(1)"))
+
+def _additional_info_from(sections) -> Dict[str, str]:
     additional_info = {}
-    sections = soup.find_all("div", class_="mod_b type02_m057 clearfix")
     for section in sections:
         header = section.find("h3")
         content = section.find("div", class_="content")
@@ -97,11 +117,13 @@ def _get_additional_info(soup: BeautifulSoup) -> Dict[str, str]:
             additional_info[key] = value
     return additional_info
 
-def _get_detail_info(soup: BeautifulSoup) -> Dict[str, str]:
+@timed_extractor
+def _get_additional_info(soup: BeautifulSoup) -> Dict[str, str]:
+    return _additional_info_from(soup.find_all("div", class_="mod_b type02_m057 clearfix"))
+
+def _detail_info_from(info_item_lists) -> Dict[str, str]:
     detail_info = {}
-    info_tags = soup.find_all("div", class_="bd")
-    for info_tag in info_tags:
-        info_items = info_tag.find_all("li")
+    for info_items in info_item_lists:
         for item in info_items:
             info_text = item.get_text(separator=" ", strip=True).replace(" ", "")
             if "本書分類" not in info_text:
@@ -127,64 +149,140 @@ def _get_detail_info(soup: BeautifulSoup) -> Dict[str, str]:
                         detail_info[key_value[0]] = key_value[1]
     return detail_info
 
-async def scrape_book_info(book_id: str, include_introduce: bool = False) -> Optional[str]:
-    url = f'https://www.books.com.tw/products/{book_id}?sloc=main'
-    headers = {
-        'User-Agent': 'Mozilla/5.0'
+@timed_extractor
+def _get_detail_info(soup: BeautifulSoup) -> Dict[str, str]:
+    return _detail_info_from(info_tag.find_all("li") for info_tag in soup.find_all("div", class_="bd"))
+
+def _classes(tag) -> list:
+    return tag.get("class") or []
+
+# 單次前序走訪整棵 DOM，依標籤與 class 收集各欄位需要的節點，取代各 _get_* 各自從頭搜尋整份文件；
+# 比對規則與各 _get_* 的 find／select 相同（含第一個符合者與文件順序），輸出完全一致
+def _scan_product_page(soup: BeautifulSoup) -> Dict:
+    nodes = {"cover": None, "title": None, "author": None, "price": None,
+             "bd_items": [], "sort_items": [], "sections": []}
+    # (節點, 所在各 div.bd 的 li 清單, 是否為第一個子元素, 是否位於 .price 的第一個 li 之下)
+    stack = [(soup, (), True, False)]
+    while stack:
+        tag, bd_lists, first, in_price_li = stack.pop()
+        name = tag.name
+        classes = _classes(tag)
+        if name == "div":
+            joined = " ".join(classes)
+            if joined == "mod type02_p002 clearfix":
+                if nodes["title"] is None:
+                    nodes["title"] = tag
+            elif joined == "type02_p003 clearfix":
+                if nodes["author"] is None:
+                    nodes["author"] = tag
+            elif joined == "mod_b type02_m057 clearfix":
+                nodes["sections"].append(tag)
+            if "bd" in classes:
+                items = []
+                nodes["bd_items"].append(items)
+                bd_lists = bd_lists + (items,)
+        elif name == "li":
+            # 巢狀的 div.bd 會讓同一個 li 出現在每一層的清單中，與逐一 find_all 的結果相同
+            for items in bd_lists:
+                items.append(tag)
+            parent = tag.parent
+            if "sort" in _classes(parent) and parent.parent is not None and "bd" in _classes(parent.parent):
+                nodes["sort_items"].append(tag)
+        elif name == "img":
+            if nodes["cover"] is None and "cover" in classes:
+                nodes["cover"] = tag
+        elif name == "em":
+            if nodes["price"] is None and first and in_price_li:
+                nodes["price"] = tag
+
+        child_in_price_li = name == "li" and first and "price" in _classes(tag.parent)
+        children = [child for child in tag.contents if isinstance(child, Tag)]
+        for index in range(len(children) - 1, -1, -1):
+            stack.append((children[index], bd_lists, index == 0, child_in_price_li))
+    return nodes
+
+@timed_extractor
+def _extract_product_fields(soup: BeautifulSoup) -> Dict:
+    nodes = _scan_product_page(soup)
+    detail_info = _detail_info_from(nodes["bd_items"])
+    isbn = detail_info.pop("ISBN", "")
+    return {
+        "ISBN": isbn,
+        "image": _image_url_from(nodes["cover"]),
+        "title": _title_from(nodes["title"]),
+        "price": _price_from(nodes["price"]),
+        **_author_from(nodes["author"]),
+        "category_trees": _category_tree_from(nodes["sort_items"]),
+        "detail_info": detail_info,
+        "additional_info": _additional_info_from(nodes["sections"])
     }
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url, headers=headers)
-            response.raise_for_status()
-            # 如果不是 200，手動記錄錯誤並回傳 None
-            if response.status_code != 200:
-                print(f"⚠ 無法取得書籍頁面：HTTP {response.status_code} {url}")
-                return None
-            soup = BeautifulSoup(response.text, "html.parser")
-            book_info = {
-                "image": _get_image_url(soup),
-                "title": _get_title(soup),
-                "price": _get_price(soup)
-            }
-            author_info = _get_author(soup)
-            detail_info = _get_detail_info(soup)
-            isbn = detail_info.pop("ISBN", "")
-            category_trees = _get_category_tree(soup)
-            result = {
-                "ISBN": isbn,
-                **book_info,
-                **author_info,
-                "category_trees": category_trees,
-                "detail_info": detail_info
-            }
-            if include_introduce:
-                additional_info = _get_additional_info(soup)
-                result.update(additional_info)
-            return result
-    except Exception as e:
-        print(f"錯誤：{str(e)}")
-        return None
 
-async def scrape_book_introduce(book_id: str) -> Optional[str]:
-    url = f'https://www.books.com.tw/products/{book_id}?sloc=main'
+def _parse_product_page(html: str) -> Dict:
+    return _extract_product_fields(make_soup(html))
+
+def product_page_url(book_id: str) -> str:
+    return f'https://www.books.com.tw/products/{book_id}?sloc=main'
+
+async def fetch_product_page(book_id: str) -> Optional[Dict]:
+    # 詳細資料與簡介共用同一份商品頁：每頁只下載、解析一次並短暫快取
+    url = product_page_url(book_id)
+    page = product_page_cache.get(url)
+    if page is not None:
+        return page
+    return await upstream_flight.do(("product_page", url), lambda: _load_product_page(url))
+
+async def _load_product_page(url: str) -> Optional[Dict]:
+    # 多 worker 部署時先查跨行程快取，同一頁只由一個 worker 抓取與解析
+    page = await shared_load(f"product_page:{url}", lambda: _fetch_product_page(url), PAGE_STORE_PRODUCT_MAX_AGE,
+                             cacheable=is_fresh_page)
+    if is_fresh_page(page):
+        product_page_cache.set(url, page)
+    return page
+
+def is_fresh_page(page: Optional[Dict]) -> bool:
+    # 上游無法使用時由本機舊頁面解析的結果帶有 _stale，不放進任何快取
+    return page is not None and not page.get("_stale")
+
+async def _fetch_product_page(url: str) -> Optional[Dict]:
     headers = {
         'User-Agent': 'Mozilla/5.0'
     }
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url, headers=headers)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, "html.parser")
-            result = {
-                "title": _get_title(soup)
-            }
-            additional_info = _get_additional_info(soup)
-            result.update(additional_info)
-            return json.dumps(result, ensure_ascii=False, indent=4)
+        response = await fetch_page(url, headers=headers, max_age=PAGE_STORE_PRODUCT_MAX_AGE)
+        response.raise_for_status()
+        # 如果不是 200，手動記錄錯誤並回傳 None
+        if response.status_code != 200:
+            print(f"⚠ 無法取得書籍頁面：HTTP {response.status_code} {url}")
+            return None
+        page = await run_parse(_parse_product_page, response.text)
+        if is_stale_fallback(response):
+            page["_stale"] = True
+        return page
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         print(f"錯誤：{str(e)}")
         return None
 
+async def scrape_book_info(book_id: str, include_introduce: bool = False) -> Optional[str]:
+    page = await fetch_product_page(book_id)
+    if page is None:
+        return None
+    result = {key: value for key, value in page.items() if key != "additional_info"}
+    if include_introduce:
+        result.update(page["additional_info"])
+    return result
+
+async def scrape_book_introduce(book_id: str) -> Optional[dict]:
+    page = await fetch_product_page(book_id)
+    if page is None:
+        return None
+    result = {
+        "title": page["title"]
+    }
+    result.update(page["additional_info"])
+    return result
+
 # 非同步 CLI 測試入口
 async def main():
     while True:
@@ -36,6 +36,20 @@ class BookInfo(BaseModel):
     }
 
 
+class BookBatchRequest(BaseModel):
+    ids: List[str]
+    introduce: bool = False
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "ids": ["0011016236", "0010950871"],
+                "introduce": False
+            }
+        }
+    }
+
+
 class BookIntroduce(BaseModel):
     title: str
     內容簡介: str
@@ -114,13 +128,15 @@ class BookSearchResponse(BaseModel):
     search_criteria: BookSearchCriteria
     stats: BookStats
     books: List[BookSearchResultItem]
+    next_cursor: Optional[str] = None
 
     model_config = {
         "json_schema_extra": {
             "example": {
                 "search_criteria": BookSearchCriteria.model_config["json_schema_extra"]["example"],
                 "stats": BookStats.model_config["json_schema_extra"]["example"],
-                "books": [BookSearchResultItem.model_config["json_schema_extra"]["example"]]
+                "books": [BookSearchResultItem.model_config["json_schema_extra"]["example"]],
+                "next_cursor": "eyJ2IjoxLCJxIjpbIlB5dGhvbiIsMSwiIiwiIiwiIiwiMCIsIjk5OTk5OSJdLCJwIjo2LCJzIjo1LCJuIjoyODI0LCJ0Ijo0OH0"
             }
         }
     }
@@ -155,4 +171,44 @@ class BookRankResponse(BaseModel):
         "json_schema_extra": {
             "example": [BookRankItem.model_config["json_schema_extra"]["example"]]
         }
-    }
\ No newline at end of file
+    }
+
+
+class LocalBookItem(BaseModel):
+    productId: str
+    title: str
+    authors: List[str]
+    publisher: str
+    image: str
+    language: Optional[str]
+    publishDate: Optional[str]
+    price: Optional[int]
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "productId": "0011016236",
+                "title": "問ChatGPT也不會的Python量化交易聖經",
+                "authors": ["張峮瑋", "黃子靜"],
+                "publisher": "深智數位",
+                "image": "https://example.com/image.jpg",
+                "language": "繁體中文",
+                "publishDate": "2023-12-01",
+                "price": 450
+            }
+        }
+    }
+
+
+class LocalSearchResponse(BaseModel):
+    total: int
+    books: List[LocalBookItem]
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "total": 1,
+                "books": [LocalBookItem.model_config["json_schema_extra"]["example"]]
+            }
+        }
+    }
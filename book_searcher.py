@@ -1,21 +1,192 @@
 import httpx
-from bs4 import BeautifulSoup
 import json
 import re
 import asyncio
+import base64
+import os
+import time
+import unicodedata
 from datetime import datetime
 from urllib.parse import quote
-class AsyncBookSearcher:
-    __PAGES_TO_FETCH = 5
-    __MAX_CONCURRENT_REQUESTS = 3
+from page_store import fetch_page, is_stale_fallback, page_fetched_at, PAGE_STORE_SEARCH_MAX_AGE, PAGE_STORE_RANK_MAX_AGE
+from rate_limit import UpstreamUnavailable
+from singleflight import upstream_flight
+from html_parser import make_soup
+from parse_executor import run_parse
+from metrics import semaphore_wait, timed_extractor
+from shared_cache import shared_get, shared_load
+
+# 每次請求預設抓取的頁數、單次請求可指定的頁數上限，以及同一搜尋的同時連線數
+SEARCH_PAGES_TO_FETCH = int(os.getenv("SEARCH_PAGES_TO_FETCH", "5"))
+SEARCH_MAX_PAGES_PER_REQUEST = int(os.getenv("SEARCH_MAX_PAGES_PER_REQUEST", "10"))
+SEARCH_MAX_CONCURRENT_REQUESTS = int(os.getenv("SEARCH_MAX_CONCURRENT_REQUESTS", "3"))
+# 指定 date_after 時：預設要湊到的符合筆數，以及單次請求最多抓取的頁數（預設與一般搜尋的頁數相同，避免耗盡速率預算）
+SEARCH_DATE_MIN_RESULTS = int(os.getenv("SEARCH_DATE_MIN_RESULTS", "20"))
+SEARCH_DATE_PAGE_BUDGET = int(os.getenv("SEARCH_DATE_PAGE_BUDGET", str(SEARCH_PAGES_TO_FETCH)))
+
+_CURSOR_VERSION = 1
+_CURSOR_QUERY_FIELDS = ('keyword', 'stock', 'author', 'publisher', 'date_after', 'price_min', 'price_max')
+
+
+def encode_search_cursor(query, next_page, page_size, total_items, total_pages):
+    # 續查游標：編碼查詢條件、下一個上游頁碼與總數，續查時不需再探測第一頁
+    payload = {
+        'v': _CURSOR_VERSION,
+        'q': [query[field] for field in _CURSOR_QUERY_FIELDS],
+        'p': next_page,
+        's': page_size,
+        'n': total_items,
+        't': total_pages
+    }
+    raw = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_search_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if payload.get('v') != _CURSOR_VERSION or len(payload['q']) != len(_CURSOR_QUERY_FIELDS):
+            raise ValueError
+        decoded = {
+            'query': dict(zip(_CURSOR_QUERY_FIELDS, payload['q'])),
+            'page': int(payload['p']),
+            'page_size': int(payload['s']),
+            'total_items': int(payload['n']),
+            'total_pages': int(payload['t'])
+        }
+        # 偽造的頁碼會讓上游收到 /page/0、/page/-3 之類的無效請求並消耗速率預算
+        if decoded['page'] < 1 or decoded['page_size'] < 1:
+            raise ValueError
+        return decoded
+    except (ValueError, KeyError, TypeError):
+        raise ValueError('無效的游標')
+
+
+SEARCH_BASE_URL = 'https://search.books.com.tw/search/query/sort/1/v/0'
+SEARCH_PRICE_MIN = 0
+SEARCH_PRICE_MAX = 999999
+
+
+def _normalize_text(value) -> str:
+    # 全形英數與空白轉半形（NFKC），連續空白合併為一個
+    return " ".join(unicodedata.normalize("NFKC", str(value or "")).split())
+
+
+def _normalize_price(value, default: int) -> int:
+    text = str(value).strip() if value is not None else ""
+    return int(text) if text.isdigit() else default
+
+
+# 正規化後的搜尋條件：唯一的上游搜尋網址產生處，網址同時作為單一請求合併、共用快取與本機頁面儲存的 key，
+# 寫法不同但等價的查詢（空白、全形字、價格字串與整數、未補零的日期、預設價格區間）會對應到同一組網址
+class SearchQuery:
+    __slots__ = ("keyword", "stock", "author", "publisher", "date_after", "price_min", "price_max")
+
+    def __init__(self, keyword, stock=1, author='', publisher='', date_after='', price_min=SEARCH_PRICE_MIN,
+                 price_max=SEARCH_PRICE_MAX):
+        self.keyword = _normalize_text(keyword)
+        self.author = _normalize_text(author)
+        self.publisher = _normalize_text(publisher)
+        self.stock = 1 if stock and str(stock).strip() != '0' else 0
+        self.date_after = ''
+        if date_after:
+            try:
+                self.date_after = datetime.strptime(str(date_after).strip(), '%Y-%m-%d').strftime('%Y-%m-%d')
+            except ValueError:
+                raise ValueError('日期格式錯誤！請使用 YYYY-MM-DD 格式')
+        price_min = _normalize_price(price_min, SEARCH_PRICE_MIN)
+        price_max = _normalize_price(price_max, SEARCH_PRICE_MAX)
+        self.price_min, self.price_max = min(price_min, price_max), max(price_min, price_max)
+
+    @property
+    def date_after_obj(self):
+        return datetime.strptime(self.date_after, '%Y-%m-%d') if self.date_after else None
+
+    @property
+    def key(self) -> tuple:
+        # 作者與出版社會併入關鍵字送出，因此只以合併後的關鍵字區分查詢
+        return self.stock, self.price_min, self.price_max, self.date_after, self.terms
+
+    @property
+    def terms(self) -> str:
+        return " ".join(filter(None, (self.keyword, self.author, self.publisher)))
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in _CURSOR_QUERY_FIELDS}
+
+    def page_url(self, page: int) -> str:
+        url = SEARCH_BASE_URL
+        if self.stock:
+            url += '/adv_forsale/1'
+        if self.price_min != SEARCH_PRICE_MIN or self.price_max != SEARCH_PRICE_MAX:
+            url += f'/adv_price_min/{self.price_min}/adv_price_max/{self.price_max}'
+        if self.date_after:
+            url += f'/adv_date/{self.date_after}'
+        return f'{url}/page/{page}/key/{quote(self.terms)}'
+
+    def __eq__(self, other):
+        return isinstance(other, SearchQuery) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+
+def _cacheable_page(result) -> bool:
+    # 上游錯誤與上游無法使用時以本機舊頁面頂替的結果（stale）都不放進快取
+    return 'status_code' not in result and not result.get('stale')
+
+
+RANK_TYPES = {
+    0: "realtime",
+    1: "newbook",
+    2: "saletop",
+    3: "pre-ordertop"
+}
+
+# 排行榜的書籍分類代碼（0 為總榜）
+RANK_BOOK_TYPES = (
+    "0", "01", "02", "03", "04", "07", "12", "06", "08", "09", "10",
+    "11", "14", "24", "13", "22", "15", "16", "17", "18", "19", "20"
+)
+
+
+def _publish_date(book):
+    publish_date_str = book.get('PublishDate') or book.get('publishDate')  # 保險些
+    if not publish_date_str:
+        return None
+    try:
+        return datetime.strptime(publish_date_str, '%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+# 依頁序追蹤已看過書籍的出版日期：目前為止全部由新到舊排列時，視為依出版日期排序，
+# 一旦出現早於 date_after 的書，後面的頁面就不可能再有符合的書
+class _PublishOrder:
+    def __init__(self):
+        self.descending = True
+        self.last_date = None
+        self.dated = 0
+
+    def update(self, books, date_after_obj) -> bool:
+        for book in books:
+            publish_date_obj = _publish_date(book)
+            if publish_date_obj is None:
+                continue
+            if self.last_date is not None and publish_date_obj > self.last_date:
+                self.descending = False
+            self.last_date = publish_date_obj
+            self.dated += 1
+        return self.descending and self.dated >= 2 and self.last_date < date_after_obj
+
 
-    def _compose_keyword(self, keyword: str, author: str, publisher: str) -> str:
-        components = [keyword]
-        if author:
-            components.append(author)
-        if publisher:
-            components.append(publisher)
-        return quote(" ".join(components))
+class AsyncBookSearcher:
+    __PAGES_TO_FETCH = SEARCH_PAGES_TO_FETCH
+    __MAX_PAGES_PER_REQUEST = SEARCH_MAX_PAGES_PER_REQUEST
+    __MAX_CONCURRENT_REQUESTS = SEARCH_MAX_CONCURRENT_REQUESTS
+    __DATE_MIN_RESULTS = SEARCH_DATE_MIN_RESULTS
+    __DATE_PAGE_BUDGET = SEARCH_DATE_PAGE_BUDGET
 
     def __init__(self):
         self.headers = {
@@ -23,8 +194,11 @@ class AsyncBookSearcher:
         }
 
     def parse_book_data(self, response_text):
+        return self._parse_book_items(make_soup(response_text))
+
+    @timed_extractor
+    def _parse_book_items(self, sp):
         try:
-            sp = BeautifulSoup(response_text, "html.parser")
             books = []
             book_items = sp.find_all('tbody', id=lambda x: x and x.startswith('itemlist_'))
             for item in book_items:
@@ -68,192 +242,319 @@ class AsyncBookSearcher:
             return []
 
     def get_search_stats(self, response_text):
+        # 只需要兩個數字：先切出 search_results 區塊解析，找不到時才解析整份文件
+        start = response_text.find('class="search_results"')
+        if start != -1:
+            start = response_text.rfind('<div', 0, start)
+            end = response_text.find('</div>', start)
+            if start != -1 and end != -1:
+                stats = self._parse_search_stats(make_soup(response_text[start:end + len('</div>')]))
+                if stats is not None:
+                    return stats
+        return self._parse_search_stats(make_soup(response_text)) or (0, 0)
+
+    @timed_extractor
+    def _parse_search_stats(self, sp):
+        # 找不到統計區塊時回傳 None；區塊存在但為「頁次 1/0」是真正的零筆結果
+        results_div = sp.find('div', class_='search_results')
+        if results_div is None:
+            return None
         try:
-            sp = BeautifulSoup(response_text, "html.parser")
-            results_div = sp.find('div', class_='search_results')
-            if results_div:
-                total_items = results_div.find('span').text.strip()
-                total_pages = results_div.text.split('/')[-1].strip()
-                return (
-                    int(total_items),
-                    int(total_pages)
-                )
+            total_items = results_div.find('span').text.strip()
+            total_pages = results_div.text.split('/')[-1].strip()
+            return (
+                int(total_items),
+                int(total_pages)
+            )
         except Exception as e:
             print(f"解析搜尋統計資料時發生錯誤: {str(e)}")
         return (0, 0)
 
-    async def check_search_connection(self, keyword, stock=1, author='', publisher='', date_after='', price_min='0',
-                                      price_max='999999'):
+    def parse_search_page(self, response_text):
+        # 第一頁只解析一次，同時取得統計資料與書籍列表
+        sp = make_soup(response_text)
+        return self._parse_search_stats(sp) or (0, 0), self._parse_book_items(sp)
+
+    async def check_search_connection(self, keyword, stock=1, author='', publisher='', date_after='',
+                                      price_min=SEARCH_PRICE_MIN, price_max=SEARCH_PRICE_MAX):
+        # 回傳 (狀態碼, (總筆數, 總頁數) 或錯誤訊息)
+        # 搜尋已解析過第一頁時直接沿用其統計資料，否則只解析統計區塊；原始頁面與搜尋共用本機頁面儲存
         try:
-            if date_after:
-                try:
-                    datetime.strptime(date_after, '%Y-%m-%d')
-                except ValueError:
-                    return 400, '日期格式錯誤！請使用 YYYY-MM-DD 格式'
-
-            price_min = price_min if str(price_min).isdigit() else "0"
-            price_max = price_max if str(price_max).isdigit() else "999999"
-
-            base_url = 'https://search.books.com.tw/search/query/sort/1/v/0'
-            if stock:
-                base_url += f'/adv_forsale/{stock}'
-            if price_min != "0" or price_max != "999999":
-                base_url += f'/adv_price_min/{price_min}/adv_price_max/{price_max}'
-            if date_after:
-                base_url += f'/adv_date/{date_after}'
-
-            keyword_encoded = self._compose_keyword(keyword, author, publisher)
-            final_url = f'{base_url}/key/{keyword_encoded}'
-
-            async with httpx.AsyncClient(headers=self.headers) as client:
-                response = await client.get(final_url)
-                if response.status_code == 200:
-                    return 200, response.text
-                else:
-                    return response.status_code, f'HTTP錯誤: {response.status_code}'
+            try:
+                query = SearchQuery(keyword, stock, author, publisher, date_after, price_min, price_max)
+            except ValueError as e:
+                return 400, str(e)
+            url = query.page_url(1)
+            result = await shared_get(f"search_page:{url}")
+            if result is None:
+                result = await upstream_flight.do(
+                    ("search_stats", url),
+                    lambda: shared_load(
+                        f"search_stats:{url}", lambda: self._fetch_search_stats(url),
+                        PAGE_STORE_SEARCH_MAX_AGE, cacheable=_cacheable_page
+                    )
+                )
+            if 'stats' not in result:
+                return result['status_code'], f'HTTP錯誤: {result["status_code"]}'
+            return 200, tuple(result['stats'])
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             return 500, f'發生錯誤: {str(e)}'
 
-    async def get_search_results(self, keyword, stock=1, author='', publisher='', date_after='', price_min=0,
-                                 price_max=999999, start_page=1):
+    async def get_search_results(self, keyword, stock=1, author='', publisher='', date_after='',
+                                 price_min=SEARCH_PRICE_MIN, price_max=SEARCH_PRICE_MAX, start_page=1, page_size=None, known_totals=None, min_results=None):
+        page_results = {}
+        search_criteria = stats = None
+        async for record in self.iter_search_results(keyword, stock, author, publisher, date_after, price_min,
+                                                     price_max, start_page, page_size, known_totals, min_results):
+            if record['type'] == 'error':
+                return None, None, None, record['error']
+            if record['type'] == 'page':
+                page_results[record['page']] = record['books']
+            else:
+                search_criteria, stats = record['search_criteria'], record['stats']
+
+        all_books = [book for page in sorted(page_results) for book in page_results[page]]
+        return search_criteria, stats, all_books, None
+
+    async def iter_search_results(self, keyword, stock=1, author='', publisher='', date_after='',
+                                  price_min=SEARCH_PRICE_MIN, price_max=SEARCH_PRICE_MAX, start_page=1, page_size=None, known_totals=None,
+                                  min_results=None):
+        # 每頁抓取並解析完成就立即產出（依完成順序），最後產出統計資料
+        # known_totals=(total_items, total_pages) 來自續查游標，從第 2 頁之後開始時可略過第一頁探測
+        # 指定 date_after 時改為依頁序分批抓取，直到湊滿 min_results 筆、用完頁數預算或確定後續頁面不會再符合
+        tasks = []
         try:
-            if date_after:
-                try:
-                    datetime.strptime(date_after, '%Y-%m-%d')
-                except ValueError:
-                    return None, None, None, '日期格式錯誤！請使用 YYYY-MM-DD 格式'
-
-            price_min = int(price_min) if isinstance(price_min, (int, str)) and str(price_min).isdigit() else 0
-            price_max = int(price_max) if isinstance(price_max, (int, str)) and str(price_max).isdigit() else 999999
-
-            base_url = 'https://search.books.com.tw/search/query/sort/1/v/0'
-            if stock:
-                base_url += f'/adv_forsale/{stock}'
-            if price_min != "0" or price_max != "999999":
-                base_url += f'/adv_price_min/{price_min}/adv_price_max/{price_max}'
-            if date_after:
-                base_url += f'/adv_date/{date_after}'
-
-            keyword_encoded = self._compose_keyword(keyword, author, publisher)
-            first_page_url = f'{base_url}/page/1/key/{keyword_encoded}'
-
-            async with httpx.AsyncClient(headers=self.headers) as client:
-                response = await client.get(first_page_url)
-                if response.status_code != 200:
-                    return None, None, None, f'HTTP錯誤: {response.status_code}'
-
-                total_items, total_pages = self.get_search_stats(response.text)
-                if start_page > total_pages:
-                    return None, None, None, f'起始頁碼 {start_page} 超過總頁數 {total_pages}'
-
-                end_page = min(start_page + self.__PAGES_TO_FETCH - 1, total_pages)#__PAGES_TO_FETCH == 5
-                semaphore = asyncio.Semaphore(self.__MAX_CONCURRENT_REQUESTS) #__MAX_CONCURRENT_REQUESTS = 3
-                async def fetch_and_parse(page):
-                    page_url = f'{base_url}/page/{page}/key/{keyword_encoded}'
-                    async with semaphore:
-                        res = await client.get(page_url)
-                        if res.status_code == 200:
-                            return self.parse_book_data(res.text)
-                        else:
-                            print(f"獲取第 {page} 頁失敗: {res.status_code}")
-                            return []
-
-                tasks = [fetch_and_parse(page) for page in range(start_page, end_page + 1)]
-                all_page_results = await asyncio.gather(*tasks)
-
-
-                all_books = []
-                if date_after:
-                    try:
-                        date_after_obj = datetime.strptime(date_after, '%Y-%m-%d')
-                    except ValueError:
-                        return None, None, None, f'date_after 格式錯誤，請用 YYYY-MM-DD'
-
-                    for page_books in all_page_results:
-                        for book in page_books:
-                            publish_date_str = book.get('PublishDate') or book.get('publishDate')  # 保險些
-                            # try:
-                            if publish_date_str:
-                                publish_date_obj = datetime.strptime(publish_date_str, '%Y-%m-%d')
-                                if publish_date_obj >= date_after_obj:
-                                        all_books.append(book)
-                                    # else:
-                                    #     #print(f" 排除 {book.get('Title', '')}（出版日 {publish_date_str}）")
-                                # else:
-                                #     print(f"⚠ 無出版日，排除：{book.get('Title', '')}")
-                            # except ValueError:
-                            #     print(f"⚠ 出版日格式錯誤，排除：{book.get('Title', '')}")
+            query = SearchQuery(keyword, stock, author, publisher, date_after, price_min, price_max)
+        except ValueError as e:
+            yield {'type': 'error', 'error': str(e)}
+            return
+        if query.date_after:
+            page_size = max(1, min(page_size or self.__DATE_PAGE_BUDGET, self.__DATE_PAGE_BUDGET))
+        else:
+            page_size = max(1, min(page_size or self.__PAGES_TO_FETCH, self.__MAX_PAGES_PER_REQUEST))
+        try:
+            date_after_obj = query.date_after_obj
+            first_page = None
+            stale = False
+            fetched_at = time.time()
+            if known_totals and start_page > 1:
+                total_items, total_pages = known_totals
+            else:
+                first_page = await self._load_first_page(query)
+                if 'books' not in first_page:
+                    yield {'type': 'error', 'error': f'HTTP錯誤: {first_page["status_code"]}'}
+                    return
+                total_items, total_pages = first_page['stats']
+            if start_page > total_pages:
+                yield {'type': 'error', 'error': f'起始頁碼 {start_page} 超過總頁數 {total_pages}'}
+                return
+
+            budget_end = min(start_page + page_size - 1, total_pages)
+            semaphore = asyncio.Semaphore(self.__MAX_CONCURRENT_REQUESTS)
+            async def fetch_and_parse(page):
+                page_url = query.page_url(page)
+                wait_start = time.perf_counter()
+                async with semaphore:
+                    semaphore_wait.observe(time.perf_counter() - wait_start, "search_pages")
+                    res = await fetch_page(page_url, headers=self.headers, max_age=PAGE_STORE_SEARCH_MAX_AGE)
+                    if res.status_code == 200:
+                        return {'books': await run_parse(self.parse_book_data, res.text),
+                                'stale': is_stale_fallback(res), 'fetched_at': page_fetched_at(res)}
+                    else:
+                        print(f"獲取第 {page} 頁失敗: {res.status_code}")
+                        return {'books': [], 'status_code': res.status_code}
+
+            async def fetch_and_parse_shared(page):
+                nonlocal stale, fetched_at
+                if page == 1:
+                    result = first_page
                 else:
-                    # 無 date_after 就全部納入
-                    all_books = [book for page in all_page_results for book in page]
-
-            search_criteria = {
-                'keyword': keyword,
-                'author': author or None,
-                'publisher': publisher or None,
-                'in_stock_only': stock == 1,
-                'price_range': {
-                    'min': int(price_min),
-                    'max': int(price_max)
+                    page_url = query.page_url(page)
+                    result = await upstream_flight.do(
+                        ("search_books", page_url),
+                        lambda: shared_load(f"search_books:{page_url}", lambda: fetch_and_parse(page),
+                                            PAGE_STORE_SEARCH_MAX_AGE, cacheable=_cacheable_page)
+                    )
+                stale = stale or bool(result.get('stale'))
+                fetched_at = min(fetched_at, result.get('fetched_at', fetched_at))
+                return page, result['books']
+
+            collected_books = 0
+            exhausted = False
+            if date_after_obj:
+                target = min_results or self.__DATE_MIN_RESULTS
+                order = _PublishOrder()
+                end_page = start_page - 1
+                while end_page < budget_end and collected_books < target and not exhausted:
+                    # 每批最多同時抓取 __MAX_CONCURRENT_REQUESTS 頁，但依頁序檢查，湊滿即停止並取消多抓的頁面
+                    batch = [
+                        asyncio.ensure_future(fetch_and_parse_shared(page))
+                        for page in range(end_page + 1, min(end_page + self.__MAX_CONCURRENT_REQUESTS, budget_end) + 1)
+                    ]
+                    tasks.extend(batch)
+                    for task in batch:
+                        page, page_books = await task
+                        end_page = page
+                        exhausted = order.update(page_books, date_after_obj)
+                        page_books = self._filter_by_date(page_books, date_after_obj)
+                        collected_books += len(page_books)
+                        yield {
+                            'type': 'page',
+                            'page': page,
+                            'order': page - start_page,
+                            'books': page_books
+                        }
+                        if exhausted or collected_books >= target:
+                            break
+                    for task in batch:
+                        task.cancel()
+            else:
+                end_page = budget_end
+                tasks = [asyncio.ensure_future(fetch_and_parse_shared(page)) for page in range(start_page, end_page + 1)]
+                for completed in asyncio.as_completed(tasks):
+                    page, page_books = await completed
+                    page_books = list(page_books)
+                    collected_books += len(page_books)
+                    yield {
+                        'type': 'page',
+                        'page': page,
+                        'order': page - start_page,
+                        'books': page_books
+                    }
+
+            yield {
+                'type': 'stats',
+                'search_criteria': {
+                    'keyword': query.keyword,
+                    'author': query.author or None,
+                    'publisher': query.publisher or None,
+                    'in_stock_only': query.stock == 1,
+                    'price_range': {
+                        'min': query.price_min,
+                        'max': query.price_max
+                    },
+                    'date_after': query.date_after or None
                 },
-                'date_after': date_after or None
-            }
-
-            stats = {
-                'total_items': total_items,
-                'total_pages': total_pages,
-                'start_page': start_page,
-                'end_page': end_page,
-                'collected_books': len(all_books)
+                'stats': {
+                    'total_items': total_items,
+                    'total_pages': total_pages,
+                    'start_page': start_page,
+                    'end_page': end_page,
+                    'collected_books': collected_books,
+                    # 有頁面是上游無法使用時頂替的本機舊頁面
+                    'stale': stale,
+                    # 回應中最舊頁面的抓取時間，用於計算剩餘的新鮮期
+                    'fetched_at': fetched_at,
+                    'next_cursor': encode_search_cursor(
+                        query.to_dict(), end_page + 1, page_size, total_items, total_pages
+                    ) if end_page < total_pages and not exhausted else None
+                }
             }
-
-            return search_criteria, stats, all_books, None
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
-            return None, None, None, f'發生錯誤: {str(e)}'
-
-    async def book_rank(self, rank_type=2, book_type="0", is_weekly=False):
-        rank_type_mapping = {
-            0: "realtime",
-            1: "newbook",
-            2: "saletop",
-            3: "pre-ordertop"
-        }
-        rank_type_key = rank_type_mapping.get(rank_type)
+            yield {'type': 'error', 'error': f'發生錯誤: {str(e)}'}
+        finally:
+            # 呼叫端提前結束（例如串流連線中斷）時取消尚未完成的頁面
+            for task in tasks:
+                task.cancel()
+
+    async def _load_first_page(self, query):
+        url = query.page_url(1)
+        return await upstream_flight.do(
+            ("search_page", url),
+            lambda: shared_load(
+                f"search_page:{url}", lambda: self._fetch_first_page(url),
+                PAGE_STORE_SEARCH_MAX_AGE, cacheable=_cacheable_page
+            )
+        )
+
+    async def _fetch_first_page(self, url):
+        # 第一頁同時用於驗證、統計與書籍解析，不再重複下載
+        response = await fetch_page(url, headers=self.headers, max_age=PAGE_STORE_SEARCH_MAX_AGE)
+        if response.status_code != 200:
+            return {'status_code': response.status_code}
+        stats, books = await run_parse(self.parse_search_page, response.text)
+        return {'stats': stats, 'books': books, 'stale': is_stale_fallback(response),
+                'fetched_at': page_fetched_at(response)}
+
+    async def _fetch_search_stats(self, url):
+        response = await fetch_page(url, headers=self.headers, max_age=PAGE_STORE_SEARCH_MAX_AGE)
+        if response.status_code != 200:
+            return {'status_code': response.status_code}
+        stats = await run_parse(self.get_search_stats, response.text)
+        return {'stats': stats, 'stale': is_stale_fallback(response)}
+
+    def _filter_by_date(self, books, date_after_obj):
+        filtered = []
+        for book in books:
+            publish_date_obj = _publish_date(book)
+            if publish_date_obj and publish_date_obj >= date_after_obj:
+                filtered.append(book)
+        return filtered
+
+    def rank_url(self, rank_type=2, book_type="0", is_weekly=False):
+        rank_type_key = RANK_TYPES.get(rank_type)
 
         if rank_type_key == "saletop":
             attribute = "7" if is_weekly else "30"
-            url = f"https://www.books.com.tw/web/sys_saletopb/books/{book_type}/?attribute={attribute}"
-        else:
-            url_templates = {
-                "realtime": "https://www.books.com.tw/web/sys_tdrntb/books/",
-                "newbook": "https://www.books.com.tw/web/sys_newtopb/books/",
-                "pre-ordertop": "https://www.books.com.tw/web/sys_pretopb/books/"
-            }
-            url = url_templates.get(rank_type_key)
+            return f"https://www.books.com.tw/web/sys_saletopb/books/{book_type}/?attribute={attribute}"
+        url_templates = {
+            "realtime": "https://www.books.com.tw/web/sys_tdrntb/books/",
+            "newbook": "https://www.books.com.tw/web/sys_newtopb/books/",
+            "pre-ordertop": "https://www.books.com.tw/web/sys_pretopb/books/"
+        }
+        return url_templates.get(rank_type_key)
 
+    async def book_rank(self, rank_type=2, book_type="0", is_weekly=False):
+        url = self.rank_url(rank_type, book_type, is_weekly)
         if not url:
             return {"status_code": 400, "error": "無效的排行榜類型參數"}
 
+        result = await self.load_book_rank(url)
+        return result if 'error' in result else result['books']
+
+    async def load_book_rank(self, url):
+        # 回傳 {'books', 'stale'} 或 {'status_code', 'error'}；stale 表示上游無法使用時以本機舊頁面頂替
+        # 相同排行榜的同時請求共用一次抓取與解析
+        # 多 worker 部署時各 worker 的排行榜預熱也共用同一份結果
+        return await upstream_flight.do(
+            ("book_rank", url),
+            lambda: shared_load(f"book_rank:{url}", lambda: self._fetch_book_rank(url), PAGE_STORE_RANK_MAX_AGE,
+                                cacheable=_cacheable_page)
+        )
+
+    async def _fetch_book_rank(self, url):
         try:
-            async with httpx.AsyncClient(headers=self.headers) as client:
-                response = await client.get(url)
-                if response.status_code != 200:
-                    return {"status_code": response.status_code, "error": f"HTTP 錯誤: {response.status_code}"}
+            response = await fetch_page(url, headers=self.headers, max_age=PAGE_STORE_RANK_MAX_AGE)
+            if response.status_code != 200:
+                return {"status_code": response.status_code, "error": f"HTTP 錯誤: {response.status_code}"}
 
-                soup = BeautifulSoup(response.text, "html.parser")
-                target_area = soup.select_one("div.mod.type02_m035.clearfix ul")
-                if not target_area:
-                    return {"status_code": 404, "error": "無法找到排行榜內容區域"}
+            books = await run_parse(self.parse_rank_page, response.text)
+            if books is None:
+                return {"status_code": 404, "error": "無法找到排行榜內容區域"}
 
-                return self.parse_book_rank(target_area)
+            return {"books": books, "stale": is_stale_fallback(response)}
 
         except httpx.RequestError as e:
             return {"status_code": 500, "error": f"連線錯誤: {str(e)}"}
 
+    def parse_rank_page(self, response_text):
+        soup = make_soup(response_text)
+        target_area = soup.select_one("div.mod.type02_m035.clearfix ul")
+        if not target_area:
+            return None
+        return self.parse_book_rank(target_area)
+
+    @timed_extractor
     def parse_book_rank(self, target_area):
         books = []
         for item in target_area.find_all("li", class_="item"):
             rank = item.find("strong", class_="no").text if item.find("strong", class_="no") else None
+            # 直接轉為整數，回應不再經過 Pydantic 轉型
+            rank = int(rank.strip()) if rank and rank.strip().isdigit() else None
             image_url = item.find("img", class_="cover")["src"] if item.find("img", class_="cover") else None
             product_link = item.find("h4").find("a")["href"] if item.find("h4") and item.find("h4").find("a") else None
             title = item.find("h4").find("a").text if item.find("h4") and item.find("h4").find("a") else None
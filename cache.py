@@ -0,0 +1,184 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from rate_limit import PRIORITY_INTERACTIVE, fetch_priority
+
+BOOK_CACHE_MAX_ENTRIES = int(os.getenv("BOOK_CACHE_MAX_ENTRIES", "5000"))
+BOOK_CACHE_MAX_BYTES = int(os.getenv("BOOK_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+BOOK_CACHE_TTL = float(os.getenv("BOOK_CACHE_TTL", "3600"))
+BOOK_CACHE_STALE_TTL = float(os.getenv("BOOK_CACHE_STALE_TTL", "86400"))
+PRODUCT_PAGE_CACHE_MAX_ENTRIES = int(os.getenv("PRODUCT_PAGE_CACHE_MAX_ENTRIES", "1000"))
+PRODUCT_PAGE_CACHE_TTL = float(os.getenv("PRODUCT_PAGE_CACHE_TTL", "300"))
+
+
+def _approx_size(value: Any) -> int:
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return len(repr(value).encode("utf-8"))
+
+
+def _cacheable(value: Any) -> bool:
+    return value is not None
+
+
+class _Entry:
+    __slots__ = ("value", "size", "fresh_until", "stale_until")
+
+    def __init__(self, value: Any, size: int, fresh_until: float, stale_until: float):
+        self.value = value
+        self.size = size
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+# 有上限（筆數＋約略位元組數）的 LRU 快取；每筆資料有 TTL，
+# 過期後在 stale 期間內仍可先回傳舊值並於背景更新
+class TTLCache:
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024,
+                 ttl: float = 600.0, stale_ttl: float = 0.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._data: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._refreshing: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.refreshes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _lookup(self, key: Hashable, now: float) -> Optional[_Entry]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if now >= entry.stale_until:
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        # 只回傳仍在 TTL 內的資料
+        now = time.monotonic()
+        entry = self._lookup(key, now)
+        if entry is None or now >= entry.fresh_until:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry.value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        size = _approx_size(value)
+        if size > self.max_bytes:
+            return
+        now = time.monotonic()
+        ttl = self.ttl if ttl is None else ttl
+        self._remove(key)
+        self._data[key] = _Entry(value, size, now + ttl, now + ttl + self.stale_ttl)
+        self._bytes += size
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            oldest_key = next(iter(self._data))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def remaining_ttl(self, key: Hashable) -> Optional[float]:
+        # 距離過期還有幾秒（已過期為 0）；不計入命中統計
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        return max(0.0, entry.fresh_until - time.monotonic())
+
+    def delete(self, key: Hashable) -> None:
+        self._remove(key)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._bytes = 0
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                          cacheable: Callable[[Any], bool] = _cacheable) -> Any:
+        now = time.monotonic()
+        entry = self._lookup(key, now)
+        if entry is not None:
+            if now < entry.fresh_until:
+                self.hits += 1
+                return entry.value
+            # stale-while-revalidate：先回舊值，背景重新抓取
+            self.stale_hits += 1
+            self._schedule_refresh(key, loader, cacheable)
+            return entry.value
+
+        self.misses += 1
+        value = await loader()
+        if cacheable(value):
+            self.set(key, value)
+        return value
+
+    def _schedule_refresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                          cacheable: Callable[[Any], bool]) -> None:
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            # 背景更新代表真正被使用的資料，即使由預取觸發也以互動優先權抓取，不會被預取讓路而放棄
+            fetch_priority.set(PRIORITY_INTERACTIVE)
+            try:
+                value = await loader()
+                if cacheable(value):
+                    self.set(key, value)
+                    self.refreshes += 1
+            except Exception as e:
+                print(f"背景更新快取失敗 {key}: {str(e)}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(refresh())
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "refreshes": self.refreshes,
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+        }
+
+
+# 書籍詳細資料快取，key 為 (pd_id, introduce)
+book_cache = TTLCache(
+    max_entries=BOOK_CACHE_MAX_ENTRIES,
+    max_bytes=BOOK_CACHE_MAX_BYTES,
+    ttl=BOOK_CACHE_TTL,
+    stale_ttl=BOOK_CACHE_STALE_TTL,
+)
+
+# 解析後的商品頁，供詳細資料與簡介兩個端點共用，key 為商品頁 URL
+product_page_cache = TTLCache(
+    max_entries=PRODUCT_PAGE_CACHE_MAX_ENTRIES,
+    max_bytes=BOOK_CACHE_MAX_BYTES,
+    ttl=PRODUCT_PAGE_CACHE_TTL,
+)
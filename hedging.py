@@ -0,0 +1,85 @@
+import os
+from collections import deque
+from typing import Dict, Optional
+
+# 對沖請求：上游超過近期延遲的百分位數仍未回應時，再送出一個相同請求，取先完成者（預設停用）
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+# 每個主機保留的近期延遲樣本數，與開始對沖前至少需要的樣本數
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# 對沖門檻的上下限（秒）
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.3"))
+HEDGE_MAX_DELAY = float(os.getenv("HEDGE_MAX_DELAY", "3"))
+# 對沖預算：每個上游請求累積的對沖額度與可累積的上限（0.1 即最多約 10% 的請求會被對沖）
+HEDGE_RATIO = float(os.getenv("HEDGE_RATIO", "0.1"))
+HEDGE_BURST = float(os.getenv("HEDGE_BURST", "5"))
+
+
+class Hedger:
+    def __init__(self, enabled: bool = HEDGE_ENABLED, percentile: float = HEDGE_PERCENTILE,
+                 window: int = HEDGE_WINDOW, min_samples: int = HEDGE_MIN_SAMPLES,
+                 min_delay: float = HEDGE_MIN_DELAY, max_delay: float = HEDGE_MAX_DELAY,
+                 ratio: float = HEDGE_RATIO, burst: float = HEDGE_BURST):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.ratio = ratio
+        self.burst = burst
+        self._samples: Dict[str, deque] = {}
+        self._budget = burst
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.skipped_budget = 0
+        self.skipped_rate_limit = 0
+
+    def observe(self, host: str, seconds: float) -> None:
+        samples = self._samples.get(host)
+        if samples is None:
+            samples = self._samples[host] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def threshold(self, host: str) -> Optional[float]:
+        # 該主機近期延遲的百分位數（限制在上下限之間）；樣本不足時回傳 None
+        samples = self._samples.get(host)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return min(self.max_delay, max(self.min_delay, ordered[index]))
+
+    def delay(self, host: str) -> Optional[float]:
+        # 每個上游請求累積對沖額度；停用或樣本不足時回傳 None（不對沖）
+        self.requests += 1
+        self._budget = min(self.burst, self._budget + self.ratio)
+        return self.threshold(host) if self.enabled else None
+
+    def try_spend(self) -> bool:
+        if self._budget < 1:
+            self.skipped_budget += 1
+            return False
+        self._budget -= 1
+        return True
+
+    def stats(self) -> Dict[str, object]:
+        thresholds = {host: self.threshold(host) for host in self._samples}
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "thresholds": {host: round(value, 3) if value is not None else None for host, value in thresholds.items()},
+            "budget": round(self._budget, 2),
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "primary_wins": self.primary_wins,
+            "skipped_budget": self.skipped_budget,
+            "skipped_rate_limit": self.skipped_rate_limit,
+        }
+
+
+upstream_hedger = Hedger()
@@ -0,0 +1,46 @@
+import os
+
+from bs4 import BeautifulSoup
+
+from metrics import timed_extractor
+
+# 可用的解析引擎：lxml（C 實作，較快）與 html.parser（純 Python，免安裝）
+PARSER_ENGINES = ("lxml", "html.parser")
+
+
+def _engine_available(engine: str) -> bool:
+    if engine == "lxml":
+        try:
+            import lxml  # noqa: F401
+        except ImportError:
+            return False
+    return engine in PARSER_ENGINES
+
+
+def _default_engine() -> str:
+    engine = os.getenv("HTML_PARSER_ENGINE", "lxml")
+    if _engine_available(engine):
+        return engine
+    if engine not in PARSER_ENGINES:
+        print(f"⚠ 不支援的 HTML_PARSER_ENGINE={engine}，改用 html.parser")
+    return "html.parser"
+
+
+_engine = _default_engine()
+
+
+def get_engine() -> str:
+    return _engine
+
+
+def set_engine(engine: str) -> None:
+    global _engine
+    if not _engine_available(engine):
+        raise ValueError(f"無法使用解析引擎：{engine}")
+    _engine = engine
+
+
+@timed_extractor
+def make_soup(html: str) -> BeautifulSoup:
+    # 所有擷取函式都透過這裡建立 soup，切換引擎不影響擷取邏輯
+    return BeautifulSoup(html, _engine)
@@ -0,0 +1,48 @@
+import hashlib
+from typing import Any, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from json_response import FastJSONResponse
+
+
+def make_etag(body: bytes) -> str:
+    # 以未壓縮內容的雜湊作為弱 ETag：gzip／br 各種壓縮結果都對應同一個驗證值
+    return 'W/"' + hashlib.blake2b(body, digest_size=10).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match 採弱比較：忽略 W/ 前綴
+    target = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+
+def cache_control(max_age: float, stale_while_revalidate: float = 0) -> str:
+    value = f"public, max-age={max(0, int(max_age))}"
+    if stale_while_revalidate > 0:
+        value += f", stale-while-revalidate={int(stale_while_revalidate)}"
+    return value
+
+
+def cacheable_json(request: Request, content: Any, max_age: float, stale_while_revalidate: float = 0) -> Response:
+    # 回應附上 ETag 與 Cache-Control；用戶端帶著相同的 If-None-Match 時只回 304，不重送內容
+    response = FastJSONResponse(content)
+    headers = {
+        "ETag": make_etag(response.body),
+        "Cache-Control": cache_control(max_age, stale_while_revalidate),
+    }
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return response
@@ -0,0 +1,168 @@
+import asyncio
+import os
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from hedging import upstream_hedger
+from metrics import upstream_hedges, upstream_rate_limit_wait, upstream_request_duration, upstream_responses
+from rate_limit import (
+    PREFETCH_TOKEN_RESERVE, PRIORITY_PREFETCH, PrefetchDeferred, UpstreamUnavailable, fetch_priority,
+    is_ban_response, upstream_breaker, upstream_limiter
+)
+from server_timing import add_timing
+
+# 上游連線設定（可用環境變數覆寫）
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "10"))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "20"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "10"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "1") == "1"
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
+}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+    )
+    # httpx 會依已安裝的解碼器自動送出 Accept-Encoding（gzip/deflate，裝了 brotli 則含 br）
+    return httpx.AsyncClient(
+        headers=DEFAULT_HEADERS,
+        timeout=UPSTREAM_TIMEOUT,
+        limits=limits,
+        http2=UPSTREAM_HTTP2 and _http2_available(),
+    )
+
+
+async def init_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_client()
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    # 未經 FastAPI lifespan 啟動時（例如 CLI 測試）也能延遲建立
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_client()
+    return _client
+
+
+async def fetch(url: str, headers: Optional[dict] = None) -> httpx.Response:
+    # 所有上游請求的唯一出口：先經過斷路器與全域速率預算，再依回應判斷是否被封鎖
+    if fetch_priority.get() == PRIORITY_PREFETCH and upstream_breaker.state != upstream_breaker.CLOSED:
+        raise PrefetchDeferred("上游狀態不穩定，暫停背景預取")
+    upstream_breaker.before_request()
+    try:
+        if fetch_priority.get() == PRIORITY_PREFETCH:
+            if not upstream_limiter.try_acquire(PREFETCH_TOKEN_RESERVE):
+                raise PrefetchDeferred("上游速率預算保留給互動請求")
+        else:
+            upstream_rate_limit_wait.observe(await upstream_limiter.acquire())
+    except UpstreamUnavailable:
+        upstream_breaker.release_probe()
+        raise
+    host = urlsplit(url).hostname or ""
+    start = time.perf_counter()
+    try:
+        delay = upstream_hedger.delay(host)
+        # 斷路器恢復確認中只放行單一探測請求；背景預取不對沖
+        if (delay is None or upstream_breaker.state != upstream_breaker.CLOSED
+                or fetch_priority.get() == PRIORITY_PREFETCH):
+            return await _send(url, headers, host)
+        return await _send_hedged(url, headers, host, delay)
+    finally:
+        add_timing("upstream", time.perf_counter() - start)
+
+
+async def _send(url: str, headers: Optional[dict], host: str) -> httpx.Response:
+    start = time.perf_counter()
+    try:
+        response = await get_client().get(url, headers=headers)
+    except (httpx.TimeoutException, httpx.NetworkError):
+        upstream_breaker.record_failure()
+        upstream_responses.inc(host, "error")
+        raise
+    except BaseException:
+        upstream_breaker.release_probe()
+        raise
+    elapsed = time.perf_counter() - start
+    upstream_request_duration.observe(elapsed, host)
+    upstream_hedger.observe(host, elapsed)
+    upstream_responses.inc(host, str(response.status_code))
+    if is_ban_response(response):
+        upstream_breaker.record_failure()
+        raise UpstreamUnavailable(f"上游拒絕存取（HTTP {response.status_code}），請稍後再試")
+    upstream_breaker.record_success()
+    return response
+
+
+async def _send_hedged(url: str, headers: Optional[dict], host: str, delay: float) -> httpx.Response:
+    # 超過對沖門檻仍未回應時，在對沖預算與全域速率預算都允許下再送出一個相同請求，
+    # 取先成功者並取消另一個；兩者都失敗時拋出先失敗者的錯誤
+    primary = asyncio.ensure_future(_send(url, headers, host))
+    started = {primary: time.perf_counter()}
+    try:
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        if not upstream_hedger.try_spend():
+            upstream_hedges.inc(host, "skipped_budget")
+            return await primary
+        if not upstream_limiter.try_acquire():
+            upstream_hedger.skipped_rate_limit += 1
+            upstream_hedges.inc(host, "skipped_rate_limit")
+            return await primary
+        hedge = asyncio.ensure_future(_send(url, headers, host))
+        started[hedge] = time.perf_counter()
+        upstream_hedger.hedged += 1
+        upstream_hedges.inc(host, "started")
+
+        pending = set(started)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            succeeded = [task for task in done if task.exception() is None]
+            if succeeded:
+                winner = primary if primary in succeeded else succeeded[0]
+                if winner is hedge:
+                    upstream_hedger.hedge_wins += 1
+                    upstream_hedges.inc(host, "hedge_won")
+                else:
+                    upstream_hedger.primary_wins += 1
+                    upstream_hedges.inc(host, "primary_won")
+                return winner.result()
+            error = error or next(iter(done)).exception()
+        raise error
+    finally:
+        # 落敗而被取消的請求以已等待的時間作為延遲樣本（實際至少這麼慢），避免門檻被低估
+        now = time.perf_counter()
+        for task, start in started.items():
+            if not task.done():
+                task.cancel()
+                upstream_hedger.observe(host, now - start)
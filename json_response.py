@@ -0,0 +1,36 @@
+import json
+import time
+from typing import Any
+
+from starlette.responses import Response
+
+from server_timing import add_timing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    # 有安裝 orjson 就用它編碼（直接輸出 UTF-8 bytes）；否則退回標準函式庫，輸出格式與 JSONResponse 相同
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# 端點直接回傳此回應時，FastAPI 不會再以 response_model 驗證與轉換，回應只編碼一次
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        start = time.perf_counter()
+        body = dumps(content)
+        add_timing("serialize", time.perf_counter() - start)
+        return body
@@ -0,0 +1,213 @@
+import asyncio
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set
+
+from book_info import _parse_product_page
+from book_searcher import AsyncBookSearcher
+from page_store import PageStore
+from parse_executor import run_parse
+
+# 本機索引最多保留的書籍數，超過時淘汰最早加入的書籍
+LOCAL_INDEX_MAX_DOCS = int(os.getenv("LOCAL_INDEX_MAX_DOCS", "200000"))
+# 啟動時由本機頁面儲存重建索引最多解析的頁數（由新到舊）
+LOCAL_INDEX_REBUILD_LIMIT = int(os.getenv("LOCAL_INDEX_REBUILD_LIMIT", "5000"))
+
+# CJK（含日文假名）連續字元為一段，其餘以英數字詞為單位
+_TOKEN_RE = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]+|[0-9a-z]+')
+_PRODUCT_ID_RE = re.compile(r'/products/([0-9A-Za-z]+)')
+_FIELD_WEIGHTS = {"title": 3, "authors": 2, "publisher": 1}
+
+
+def _is_cjk(char: str) -> bool:
+    return char >= '\u3040'
+
+
+def tokenize(text: str, unigrams: bool = True) -> List[str]:
+    # CJK 以二元組（bigram）切詞，索引時另外保留單字以支援單字查詢
+    tokens = []
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    for run in _TOKEN_RE.findall(text):
+        if not _is_cjk(run[0]):
+            tokens.append(run)
+            continue
+        if len(run) == 1 or unigrams:
+            tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _normalize_date(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    match = re.search(r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})', value)
+    if not match:
+        return None
+    year, month, day = match.groups()
+    return f"{year}-{int(month):02d}-{int(day):02d}"
+
+
+def product_id_from_link(link: Optional[str]) -> Optional[str]:
+    match = _PRODUCT_ID_RE.search(link or "")
+    return match.group(1) if match else None
+
+
+# 由搜尋結果、書籍詳細資料與排行榜累積而成的本機倒排索引
+class LocalBookIndex:
+    def __init__(self, max_docs: int = LOCAL_INDEX_MAX_DOCS):
+        self.max_docs = max_docs
+        self._docs: "OrderedDict[str, dict]" = OrderedDict()
+        self._doc_tokens: Dict[str, Dict[str, Set[str]]] = {}
+        self._postings: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _unindex(self, product_id: str) -> None:
+        for tokens in self._doc_tokens.pop(product_id, {}).values():
+            for token in tokens:
+                posting = self._postings.get(token)
+                if posting is not None:
+                    posting.discard(product_id)
+                    if not posting:
+                        del self._postings[token]
+
+    def add(self, product_id: str, **fields) -> None:
+        if not product_id:
+            return
+        # 後來的資料只補上或更新有值的欄位（例如搜尋結果沒有價格，排行榜有）
+        doc = self._docs.pop(product_id, None) or {
+            "productId": product_id, "title": "", "authors": [], "publisher": "",
+            "image": "", "language": None, "publishDate": None, "price": None
+        }
+        for key, value in fields.items():
+            if value not in (None, "", []):
+                doc[key] = value
+        self._docs[product_id] = doc
+
+        self._unindex(product_id)
+        field_tokens = {
+            "title": set(tokenize(doc["title"])),
+            "authors": set(tokenize(" ".join(doc["authors"]))),
+            "publisher": set(tokenize(doc["publisher"])),
+        }
+        self._doc_tokens[product_id] = field_tokens
+        for tokens in field_tokens.values():
+            for token in tokens:
+                self._postings.setdefault(token, set()).add(product_id)
+
+        while len(self._docs) > self.max_docs:
+            oldest_id, _ = self._docs.popitem(last=False)
+            self._unindex(oldest_id)
+
+    def add_search_books(self, books: Iterable[dict]) -> None:
+        for book in books:
+            self.add(
+                book.get("ProductID", ""),
+                title=book.get("Title"),
+                authors=book.get("Authors"),
+                publisher=book.get("Publisher"),
+                image=book.get("Image"),
+                language=book.get("Language"),
+                publishDate=_normalize_date(book.get("PublishDate")),
+            )
+
+    def add_book_info(self, product_id: str, info: dict) -> None:
+        self.add(
+            product_id,
+            title=info.get("title"),
+            authors=info.get("authors"),
+            publisher=info.get("publisher"),
+            image=info.get("image"),
+            language=info.get("language"),
+            publishDate=_normalize_date(info.get("publish_date")),
+            price=info.get("price") or None,
+        )
+
+    def add_rank_books(self, books: Iterable[dict]) -> None:
+        for book in books:
+            self.add(
+                product_id_from_link(book.get("product_link")),
+                title=book.get("title"),
+                authors=book.get("authors"),
+                image=book.get("image_url"),
+                price=book.get("price"),
+            )
+
+    def search(self, query: str, price_min: Optional[int] = None, price_max: Optional[int] = None,
+               date_after: Optional[str] = None, date_before: Optional[str] = None,
+               language: Optional[str] = None, limit: int = 20) -> dict:
+        tokens = set(tokenize(query, unigrams=False))
+        if not tokens:
+            return {"total": 0, "books": []}
+        # 所有查詢詞都必須出現（AND），從最短的倒排串列開始取交集
+        postings = sorted((self._postings.get(token, set()) for token in tokens), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                break
+
+        matched = []
+        for product_id in candidates:
+            doc = self._docs[product_id]
+            price = doc["price"]
+            if price_min is not None and (price is None or price < price_min):
+                continue
+            if price_max is not None and (price is None or price > price_max):
+                continue
+            if date_after and (not doc["publishDate"] or doc["publishDate"] < date_after):
+                continue
+            if date_before and (not doc["publishDate"] or doc["publishDate"] > date_before):
+                continue
+            if language and doc["language"] != language:
+                continue
+            field_tokens = self._doc_tokens[product_id]
+            score = sum(
+                weight * len(tokens & field_tokens[field]) for field, weight in _FIELD_WEIGHTS.items()
+            )
+            matched.append((score, doc["publishDate"] or "", product_id))
+
+        matched.sort(reverse=True)
+        return {
+            "total": len(matched),
+            "books": [dict(self._docs[product_id]) for _, _, product_id in matched[:limit]]
+        }
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self._docs),
+            "tokens": len(self._postings),
+            "max_documents": self.max_docs,
+        }
+
+
+async def rebuild_from_page_store(index: LocalBookIndex, store: PageStore, searcher: AsyncBookSearcher,
+                                  limit: int = LOCAL_INDEX_REBUILD_LIMIT) -> int:
+    # 重新解析已持久化的商品、搜尋與排行榜頁面；由舊到新加入，讓較新的資料覆蓋舊值
+    urls = await asyncio.to_thread(store.list_urls, limit)
+    indexed = 0
+    for url in reversed(urls):
+        page = await asyncio.to_thread(store.get, url)
+        if page is None:
+            continue
+        body = page.body
+        try:
+            if url.startswith("https://www.books.com.tw/products/"):
+                index.add_book_info(product_id_from_link(url), await run_parse(_parse_product_page, body))
+            elif url.startswith("https://search.books.com.tw/"):
+                index.add_search_books(await run_parse(searcher.parse_book_data, body))
+            elif url.startswith("https://www.books.com.tw/web/sys_"):
+                index.add_rank_books(await run_parse(searcher.parse_rank_page, body) or [])
+            else:
+                continue
+        except Exception as e:
+            print(f"重建本機索引時解析失敗 {url}: {str(e)}")
+            continue
+        indexed += 1
+    return indexed
+
+
+local_index = LocalBookIndex()
@@ -1,26 +1,88 @@
-from fastapi import FastAPI, Path, Query, HTTPException
+from fastapi import FastAPI, Path, Query, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional
-from book_model import BookSearchResponse, BookIntroduce, BookInfo, BookRankResponse, BookStats, BookSearchCriteria, \
-    BookSearchResultItem
-import json
-from book_info import scrape_book_info, scrape_book_introduce
-from book_searcher import AsyncBookSearcher
+from contextlib import asynccontextmanager
+from book_model import BookSearchResponse, BookIntroduce, BookInfo, BookRankResponse, BookStats, BookBatchRequest, \
+    LocalSearchResponse
+import os
+import time
+import asyncio
+from book_info import scrape_book_info, scrape_book_introduce, product_page_url, is_fresh_page
+from book_searcher import AsyncBookSearcher, decode_search_cursor
+from http_client import init_client, close_client
+from cache import book_cache, product_page_cache, BOOK_CACHE_STALE_TTL
+from singleflight import upstream_flight
+from parse_executor import init_parse_executor, shutdown_parse_executor
+from rate_limit import UpstreamUnavailable, upstream_breaker, upstream_limiter
+from hedging import upstream_hedger
+from page_store import (
+    init_page_store, close_page_store, get_page_store, run_page_store_pruner, PAGE_STORE_PRUNE_INTERVAL,
+    PAGE_STORE_SEARCH_MAX_AGE
+)
+from rank_warmer import RankWarmer
+from local_index import local_index, rebuild_from_page_store, product_id_from_link
+from prefetch import Prefetcher
+from json_response import FastJSONResponse, dumps
+from metrics import MetricsMiddleware, registry, semaphore_wait
+from server_timing import ServerTimingMiddleware, timing
+from compression import CompressionMiddleware
+from http_cache import cacheable_json
+from shared_cache import (
+    init_shared_cache, close_shared_cache, get_shared_cache, run_shared_cache_pruner, SHARED_CACHE_PRUNE_INTERVAL
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 整個應用共用一個連線池化的上游 httpx client，HTML 解析交給獨立的執行池
+    # 本機頁面儲存讓重新啟動後能直接由磁碟提供服務
+    await init_client()
+    init_parse_executor()
+    store = init_page_store()
+    shared = init_shared_cache()
+    # 由本機頁面儲存在背景重建本機全文索引，不阻擋啟動
+    rebuild_task = asyncio.create_task(rebuild_from_page_store(local_index, store, searcher)) if store else None
+    prune_task = asyncio.create_task(run_page_store_pruner(store)) if store and PAGE_STORE_PRUNE_INTERVAL > 0 else None
+    shared_prune_task = (
+        asyncio.create_task(run_shared_cache_pruner(shared)) if shared and SHARED_CACHE_PRUNE_INTERVAL > 0 else None
+    )
+    rank_warmer.start()
+    prefetcher.start()
+    yield
+    for task in (rebuild_task, prune_task, shared_prune_task):
+        if task is not None:
+            task.cancel()
+    await rank_warmer.stop()
+    await prefetcher.stop()
+    await close_client()
+    shutdown_parse_executor()
+    close_page_store()
+    close_shared_cache()
+
 
 app = FastAPI(
     title="博客來 書籍查詢 API",
     version="1.0",
-    description="提供書籍詳細資料、相關書籍列表、書籍排行榜等資料"
+    description="提供書籍詳細資料、相關書籍列表、書籍排行榜等資料",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
+
+_index_html: Optional[str] = None
+
 
 @app.get("/", response_class=HTMLResponse)
 async def home():
-    with open("index.html", encoding="utf-8") as f:
-        html_content = f.read()
-    return HTMLResponse(content=html_content)
+    # 首頁內容固定，第一次讀取後就留在記憶體
+    global _index_html
+    if _index_html is None:
+        with open("index.html", encoding="utf-8") as f:
+            _index_html = f.read()
+    return HTMLResponse(content=_index_html)
 
 searcher = AsyncBookSearcher()
+rank_warmer = RankWarmer(searcher)
 
 # 加入 CORS 中介層
 app.add_middleware(
@@ -30,6 +92,61 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(CompressionMiddleware)
+
+
+def _upstream_unavailable(e: UpstreamUnavailable) -> HTTPException:
+    # 上游被限流或封鎖時快速回 503，並告知用戶端何時再試
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(max(1, int(e.retry_after + 0.5)))}
+    )
+
+
+# 批次查詢單次可帶的書籍 ID 上限與同時抓取數
+BATCH_MAX_IDS = int(os.getenv("BATCH_MAX_IDS", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# 回應只保留 response_model 宣告的欄位；直接由快取中的 dict 投影，不再建立 Pydantic 物件再序列化
+BOOK_INFO_FIELDS = tuple(BookInfo.model_fields)
+
+
+def _project(data: dict, fields) -> dict:
+    return {field: data.get(field) for field in fields}
+
+
+def _batch_book_data(result: dict, introduce: bool) -> dict:
+    data = _project(result, BOOK_INFO_FIELDS)
+    if introduce:
+        # 簡介各段（例如 內容簡介、作者介紹）由 scrape_book_info 併入結果，不在 BookInfo 欄位內，另外附上
+        data.update((key, value) for key, value in result.items() if key not in data and not key.startswith("_"))
+    return data
+
+
+async def _load_book_info(pd_id: str, include_introduce: bool):
+    return await book_cache.get_or_load(
+        (pd_id, include_introduce),
+        lambda: _scrape_book_info_indexed(pd_id, include_introduce),
+        cacheable=is_fresh_page
+    )
+
+
+def _book_info_cached(pd_id: str) -> bool:
+    return bool(book_cache.remaining_ttl((pd_id, False)))
+
+
+# 搜尋與排行榜回應後，背景預取前幾筆書籍的詳細資料（與點選時的 /api/book/{pd_id} 共用同一快取）
+prefetcher = Prefetcher(lambda pd_id: _load_book_info(pd_id, False), _book_info_cached)
+
+
+async def _scrape_book_info_indexed(pd_id: str, include_introduce: bool):
+    result = await scrape_book_info(pd_id, include_introduce)
+    if result:
+        local_index.add_book_info(pd_id, result)
+    return result
 
 
 @app.get(
@@ -51,19 +168,78 @@ app.add_middleware(
     }
 )
 async def get_book_info(
+        request: Request,
         pd_id: str = Path(..., description="博客來商品 ID"),
         introduce: Optional[int] = Query(0, description="是否包含簡介（1=包含，0=不含）")
 ):
     try:
-        include_introduce = bool(introduce)
-        result = await scrape_book_info(pd_id, include_introduce)
+        result = await _load_book_info(pd_id, bool(introduce))
         if result:
-            return BookInfo(**result)
+            with timing("model"):
+                content = _project(result, BOOK_INFO_FIELDS)
+            if not is_fresh_page(result):
+                # 上游無法使用時以本機舊頁面頂替的資料，不讓用戶端快取
+                return cacheable_json(request, content, 0)
+            max_age = book_cache.remaining_ttl((pd_id, bool(introduce))) or 0
+            return cacheable_json(request, content, max_age, BOOK_CACHE_STALE_TTL)
         raise HTTPException(status_code=404, detail="找不到書籍資料，請確認書籍ID是否正確")
+    except HTTPException:
+        raise
+    except UpstreamUnavailable as e:
+        raise _upstream_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post(
+    "/api/books/batch",
+    summary="批次取得書籍詳細資料",
+    description=(
+            "一次查詢多本書籍的詳細資料，上游抓取以有限的並行數同時進行。\n"
+            "結果以 NDJSON 串流回傳，每完成一本就送出一行："
+            "成功為 {id, ok: true, data}（introduce=true 時 data 另含簡介各段），失敗為 {id, ok: false, status_code, error}。"
+    ),
+    responses={
+        200: {"description": "NDJSON 串流，每行一本書的結果"},
+        400: {"description": "書籍 ID 數量超過上限或為空"}
+    }
+)
+async def get_books_batch(request: BookBatchRequest):
+    pd_ids = list(dict.fromkeys(pd_id.strip() for pd_id in request.ids if pd_id.strip()))
+    if not pd_ids:
+        raise HTTPException(status_code=400, detail="請提供至少一個書籍 ID")
+    if len(pd_ids) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"一次最多查詢 {BATCH_MAX_IDS} 本書籍")
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def fetch_one(pd_id: str) -> dict:
+        wait_start = time.perf_counter()
+        async with semaphore:
+            semaphore_wait.observe(time.perf_counter() - wait_start, "batch")
+            try:
+                result = await _load_book_info(pd_id, request.introduce)
+                if not result:
+                    return {"id": pd_id, "ok": False, "status_code": 404, "error": "找不到書籍資料，請確認書籍ID是否正確"}
+                return {"id": pd_id, "ok": True, "data": _batch_book_data(result, request.introduce)}
+            except UpstreamUnavailable as e:
+                return {"id": pd_id, "ok": False, "status_code": 503, "error": str(e)}
+            except Exception as e:
+                return {"id": pd_id, "ok": False, "status_code": 500, "error": str(e)}
+
+    async def body():
+        tasks = [asyncio.ensure_future(fetch_one(pd_id)) for pd_id in pd_ids]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                yield dumps(await completed) + b"\n"
+        finally:
+            # 用戶端中途斷線時取消其餘抓取
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
 @app.get(
     "/api/book/introduce/{pd_id}",
     response_model=BookIntroduce,
@@ -83,19 +259,70 @@ async def get_book_info(
     }
 )
 async def get_book_introduce(
+        request: Request,
         pd_id: str = Path(..., description="博客來商品 ID")
 ):
     try:
         result = await scrape_book_introduce(pd_id)
-        if result:
-            result_obj = json.loads(result)
-            return BookIntroduce(**result_obj)
-
-        raise HTTPException(status_code=404, detail="找不到書籍資料，請確認書籍ID是否正確")
+        if result is None:
+            raise HTTPException(status_code=404, detail="找不到書籍資料，請確認書籍ID是否正確")
+        if "內容簡介" not in result:
+            raise HTTPException(status_code=404, detail="找不到書籍介紹")
+        with timing("model"):
+            content = {"title": result["title"], "內容簡介": result["內容簡介"]}
+        max_age = product_page_cache.remaining_ttl(product_page_url(pd_id)) or 0
+        return cacheable_json(request, content, max_age)
+    except HTTPException:
+        raise
+    except UpstreamUnavailable as e:
+        raise _upstream_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _format_search_book(book_item: dict, all_atr: bool) -> dict:
+    return {
+        'productId': book_item.get('ProductID', ''),
+        'title': book_item.get('Title', ''),
+        'author': book_item.get('Authors', []),
+        'publisher': book_item.get('Publisher', ''),
+        'image': book_item.get('Image', ''),
+        'language': book_item.get('Language') if all_atr else None,
+        'publishDate': book_item.get('PublishDate') if all_atr else None
+    }
+
+
+def _resolve_search_args(keyword, is_stock, author, publisher, date_after, price_min, price_max, page,
+                         page_size, cursor, min_results=None) -> dict:
+    # 帶有 cursor 時以游標內的查詢條件與頁碼為準，並沿用已知的總筆數／總頁數
+    if cursor:
+        try:
+            state = decode_search_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {
+            **state['query'],
+            'start_page': state['page'],
+            'page_size': page_size or state['page_size'],
+            'known_totals': (state['total_items'], state['total_pages']),
+            'min_results': min_results
+        }
+    if not keyword:
+        raise HTTPException(status_code=400, detail="請提供 keyword 或 cursor")
+    return {
+        'keyword': keyword,
+        'stock': is_stock,
+        'author': author,
+        'publisher': publisher,
+        'date_after': date_after,
+        'price_min': price_min,
+        'price_max': price_max,
+        'start_page': page,
+        'page_size': page_size,
+        'min_results': min_results
+    }
+
+
 @app.get(
     "/api/books/search",
     response_model=BookSearchResponse,
@@ -115,7 +342,8 @@ async def get_book_introduce(
     }
 )
 async def search_books(
-        keyword: str = Query(..., description="書名或關鍵字"),
+        request: Request,
+        keyword: Optional[str] = Query(None, description="書名或關鍵字（使用 cursor 續查時可省略）"),
         all_atr: bool = Query(False, description="是否包含所有書籍屬性（如語言、出版日期）"),
         page: int = Query(1, ge=1, description="起始頁碼"),
         is_stock: int = Query(1, description="是否只查有庫存書籍（1=是, 0=不限）"),
@@ -123,44 +351,109 @@ async def search_books(
         publisher: str = Query('', description="出版社名稱（可空）"),
         date_after: str = Query('', description="指定出版日期之後（YYYY-MM-DD）"),
         price_min: str = Query('0', description="最低價格"),
-        price_max: str = Query('999999', description="最高價格")
+        price_max: str = Query('999999', description="最高價格"),
+        page_size: Optional[int] = Query(None, ge=1, description="本次抓取的頁數（伺服器端有上限，預設 5）"),
+        cursor: Optional[str] = Query(None, description="上一次回應的 next_cursor，用於續查下一段結果"),
+        min_results: Optional[int] = Query(None, ge=1, description="指定 date_after 時要湊到的符合筆數（預設 20）")
 ):
+    search_args = _resolve_search_args(
+        keyword, is_stock, author, publisher, date_after, price_min, price_max, page, page_size, cursor,
+        min_results
+    )
     try:
-        status_code, result = await searcher.check_search_connection(
-            keyword, is_stock, author, publisher, date_after, price_min, price_max
-        )
-        if status_code != 200:
-            raise HTTPException(status_code=status_code, detail=result)
-
-        search_criteria, stats, books_data, error = await searcher.get_search_results(
-            keyword, is_stock, author, publisher, date_after, price_min, price_max, page
-        )
+        search_criteria, stats, books_data, error = await searcher.get_search_results(**search_args)
         if error:
             raise HTTPException(status_code=400, detail=error)
+        local_index.add_search_books(books_data)
+        prefetcher.enqueue(book_item.get('ProductID') for book_item in books_data)
 
-        formatted_books = []
-        for book_item in books_data:
-            base_info = {
-                'productId': book_item.get('ProductID', ''),
-                'title': book_item.get('Title', ''),
-                'author': book_item.get('Authors', []),
-                'publisher': book_item.get('Publisher', ''),
-                'image': book_item.get('Image', ''),
-                'language': book_item.get('Language') if all_atr else None,
-                'publishDate': book_item.get('PublishDate') if all_atr else None
-            }
-
-            formatted_books.append(base_info)
+        with timing("model"):
+            formatted_books = [_format_search_book(book_item, all_atr) for book_item in books_data]
 
-        return BookSearchResponse(
-            search_criteria=BookSearchCriteria(**search_criteria),
-            stats=BookStats(**stats),
-            books=[BookSearchResultItem(**book) for book in formatted_books]
-        )
+        # 搜尋頁在本機頁面儲存的新鮮期內不會重新向上游驗證，回應以最舊頁面剩餘的新鮮期為快取期限；含舊頁面時不快取
+        max_age = 0 if stats.get('stale') else max(0.0, PAGE_STORE_SEARCH_MAX_AGE - (time.time() - stats['fetched_at']))
+        return cacheable_json(request, {
+            'search_criteria': search_criteria,
+            'stats': {'total_items': stats['total_items'], 'total_pages': stats['total_pages']},
+            'books': formatted_books,
+            'next_cursor': stats.get('next_cursor')
+        }, max_age)
+    except HTTPException:
+        raise
+    except UpstreamUnavailable as e:
+        raise _upstream_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get(
+    "/api/books/search/stream",
+    summary="串流搜尋相關書籍",
+    description=(
+            "與 /api/books/search 相同的搜尋條件，但每頁抓取並解析完成就立即送出。\n"
+            "每筆記錄為 {type: page, page, order, books}（依完成順序），最後送出 {type: stats, search_criteria, stats}。\n"
+            "format=ndjson 以換行分隔 JSON 回傳，format=sse 以 Server-Sent Events 回傳。"
+    ),
+    responses={
+        200: {"description": "NDJSON 或 SSE 串流"},
+        400: {"description": "搜尋條件錯誤"},
+        500: {"description": "伺服器錯誤"}
+    }
+)
+async def stream_search_books(
+        keyword: Optional[str] = Query(None, description="書名或關鍵字（使用 cursor 續查時可省略）"),
+        all_atr: bool = Query(False, description="是否包含所有書籍屬性（如語言、出版日期）"),
+        page: int = Query(1, ge=1, description="起始頁碼"),
+        is_stock: int = Query(1, description="是否只查有庫存書籍（1=是, 0=不限）"),
+        author: str = Query('', description="作者名稱（可空）"),
+        publisher: str = Query('', description="出版社名稱（可空）"),
+        date_after: str = Query('', description="指定出版日期之後（YYYY-MM-DD）"),
+        price_min: str = Query('0', description="最低價格"),
+        price_max: str = Query('999999', description="最高價格"),
+        page_size: Optional[int] = Query(None, ge=1, description="本次抓取的頁數（伺服器端有上限，預設 5）"),
+        cursor: Optional[str] = Query(None, description="上一次回應的 next_cursor，用於續查下一段結果"),
+        min_results: Optional[int] = Query(None, ge=1, description="指定 date_after 時要湊到的符合筆數（預設 20）"),
+        format: str = Query('ndjson', pattern='^(ndjson|sse)$', description="串流格式（ndjson 或 sse）")
+):
+    search_args = _resolve_search_args(
+        keyword, is_stock, author, publisher, date_after, price_min, price_max, page, page_size, cursor,
+        min_results
+    )
+    records = searcher.iter_search_results(**search_args)
+    # 先取得第一筆記錄：條件錯誤或上游失敗時仍能回傳正確的 HTTP 狀態碼
+    try:
+        first_record = await records.__anext__()
+    except StopAsyncIteration:
+        raise HTTPException(status_code=500, detail="搜尋沒有產生任何結果")
+    except UpstreamUnavailable as e:
+        raise _upstream_unavailable(e)
+    if first_record['type'] == 'error':
+        await records.aclose()
+        raise HTTPException(status_code=400, detail=first_record['error'])
+
+    def encode(record: dict) -> bytes:
+        if record['type'] == 'page':
+            local_index.add_search_books(record['books'])
+            record = {**record, 'books': [_format_search_book(book, all_atr) for book in record['books']]}
+        data = dumps(record)
+        if format == 'sse':
+            return b"event: " + record['type'].encode() + b"\ndata: " + data + b"\n\n"
+        return data + b"\n"
+
+    async def body():
+        try:
+            yield encode(first_record)
+            async for record in records:
+                yield encode(record)
+        except UpstreamUnavailable as e:
+            yield encode({'type': 'error', 'error': str(e)})
+        finally:
+            await records.aclose()
+
+    media_type = "text/event-stream" if format == 'sse' else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type)
+
+
 @app.get(
     "/api/books/search/stats",
     response_model=BookStats,
@@ -185,19 +478,24 @@ async def get_search_stats(
         publisher: str = Query('', description="出版社名稱"),
         date_after: str = Query('', description="指定出版日期之後（YYYY-MM-DD）"),
         price_min: int = Query(0, description="最低價格"),
-        price_max: int = Query(99999, description="最高價格")
+        price_max: int = Query(999999, description="最高價格")
 ):
     try:
+        # 與 /api/books/search 共用第一頁的原始頁面；已解析過時沿用其統計資料，否則只解析統計區塊
         status_code, response = await searcher.check_search_connection(
             keyword, is_stock, author, publisher, date_after, price_min, price_max
         )
         if status_code != 200:
             raise HTTPException(status_code=status_code, detail=response)
-        total_items, total_pages = searcher.get_search_stats(response)
-        return {
+        total_items, total_pages = response
+        return FastJSONResponse({
             'total_items': total_items,
             'total_pages': total_pages
-        }
+        })
+    except HTTPException:
+        raise
+    except UpstreamUnavailable as e:
+        raise _upstream_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -221,6 +519,7 @@ async def get_search_stats(
     }
 )
 async def get_books_rank(
+        request: Request,
         rank_type: int = Query(
             2, description="排行榜類型（0=即時榜、1=新書榜、2=暢銷榜、3=預購榜）"
         ),
@@ -257,9 +556,124 @@ async def get_books_rank(
         )
 ):
     try:
-        result = await searcher.book_rank(rank_type, book_type, is_weekly)
+        result = await rank_warmer.get_rank(rank_type, book_type, is_weekly)
         if isinstance(result, dict) and 'error' in result:
             raise HTTPException(status_code=result.get('status_code', 400), detail=result['error'])
-        return BookRankResponse(root=result)
+        prefetcher.enqueue(product_id_from_link(book.get('product_link')) for book in result)
+        return cacheable_json(request, {'root': result}, rank_warmer.remaining_ttl(rank_type, book_type, is_weekly))
+    except HTTPException:
+        raise
+    except UpstreamUnavailable as e:
+        raise _upstream_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+
+@app.get(
+    "/api/local/search",
+    response_model=LocalSearchResponse,
+    summary="本機全文搜尋",
+    description=(
+            "只在本機索引中搜尋，不會向博客來發出請求。索引由先前的搜尋結果、書籍詳細資料與排行榜累積而成，"
+            "以中文二元組（bigram）比對書名、作者與出版社，所有查詢詞都必須符合。"
+    ),
+    responses={
+        200: {
+            "description": "本機搜尋結果",
+            "content": {
+                "application/json": {
+                    "example": LocalSearchResponse.model_config["json_schema_extra"]["example"]
+                }
+            }
+        }
+    }
+)
+async def local_search_books(
+        q: str = Query(..., min_length=1, description="搜尋字詞（書名、作者或出版社）"),
+        price_min: Optional[int] = Query(None, ge=0, description="最低價格"),
+        price_max: Optional[int] = Query(None, ge=0, description="最高價格"),
+        date_after: Optional[str] = Query(None, pattern=r'^\d{4}-\d{2}-\d{2}$', description="出版日期之後（YYYY-MM-DD）"),
+        date_before: Optional[str] = Query(None, pattern=r'^\d{4}-\d{2}-\d{2}$', description="出版日期之前（YYYY-MM-DD）"),
+        language: Optional[str] = Query(None, description="語言（例如：繁體中文）"),
+        limit: int = Query(20, ge=1, le=100, description="回傳筆數上限")
+):
+    return FastJSONResponse(local_index.search(q, price_min, price_max, date_after, date_before, language, limit))
+
+
+@app.get(
+    "/api/cache/stats",
+    summary="取得快取統計資料",
+    description="回傳書籍詳細資料、商品頁快取與本機頁面儲存的筆數、大小與命中／未命中／淘汰次數。"
+)
+async def get_cache_stats():
+    store = get_page_store()
+    shared = get_shared_cache()
+    return {
+        "book": book_cache.stats(),
+        "product_page": product_page_cache.stats(),
+        "in_flight": upstream_flight.stats(),
+        "page_store": store.stats() if store else None,
+        "rank": rank_warmer.stats(),
+        "local_index": local_index.stats(),
+        "shared": shared.stats() if shared else None,
+        "prefetch": prefetcher.stats()
+    }
+
+
+def _cache_metrics():
+    # /metrics 輸出時才讀取各快取的計數，熱路徑上不需額外記錄
+    caches = {
+        "book": book_cache.stats(),
+        "product_page": product_page_cache.stats(),
+        "rank": rank_warmer.stats(),
+    }
+    hits = [({"cache": name}, stats["hits"]) for name, stats in caches.items()]
+    misses = [({"cache": name}, stats["misses"]) for name, stats in caches.items()]
+    ratios = [
+        ({"cache": name}, stats["hits"] / (stats["hits"] + stats["misses"]) if stats["hits"] + stats["misses"] else 0)
+        for name, stats in caches.items()
+    ]
+    store = get_page_store()
+    if store is not None:
+        hits.append(({"cache": "page_store"}, store.hits + store.revalidated))
+    shared = get_shared_cache()
+    if shared is not None:
+        hits.append(({"cache": "shared"}, shared.hits + shared.wait_hits))
+        misses.append(({"cache": "shared"}, shared.misses - shared.wait_hits))
+    return [
+        ("cache_hits_total", "counter", "快取命中次數（page_store 含 304 重新驗證）", hits),
+        ("cache_misses_total", "counter", "快取未命中次數", misses),
+        ("cache_hit_ratio", "gauge", "快取命中率", ratios),
+        ("upstream_in_flight", "gauge", "進行中的上游抓取數", [({}, upstream_flight.stats()["in_flight"])]),
+        ("upstream_shared_total", "counter", "共用進行中抓取結果的次數", [({}, upstream_flight.stats()["shared"])]),
+    ]
+
+
+registry.register_collector(_cache_metrics)
+
+
+@app.get(
+    "/metrics",
+    summary="Prometheus 指標",
+    description=(
+            "以 Prometheus 文字格式回傳 API 請求、上游請求、解析與擷取函式的延遲直方圖，"
+            "以及並行數限制的等待時間與快取命中率。"
+    ),
+    response_class=PlainTextResponse
+)
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get(
+    "/api/upstream/stats",
+    summary="取得上游請求狀態",
+    description="回傳全域上游速率預算、斷路器（封鎖偵測）與對沖請求的目前狀態。"
+)
+async def get_upstream_stats():
+    return {
+        "rate_limit": upstream_limiter.stats(),
+        "circuit_breaker": upstream_breaker.stats(),
+        "hedging": upstream_hedger.stats()
+    }
@@ -0,0 +1,204 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# 不依賴 prometheus_client 的輕量指標：熱路徑上只做一次 dict 查找與 bisect，輸出時才累加成 Prometheus 文字格式
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PARSE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+METRICS_PREFIX = "bookapi_"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = METRICS_PREFIX + name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = METRICS_PREFIX + name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # 每組標籤：各區間（非累計）計數，最後一格為 +Inf；另記總和與次數
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+# 輸出時才向各元件取值的指標（例如快取命中率），回傳 (名稱, 類型, 說明, [(標籤 dict, 值)])
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: List[Collector] = []
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                name = METRICS_PREFIX + name
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "API 請求處理時間（含串流回應送完）", ("method", "route", "status")
+)
+upstream_request_duration = registry.histogram(
+    "upstream_request_duration_seconds", "上游 HTTP 請求時間（不含速率限制等待）", ("host",)
+)
+upstream_responses = registry.counter(
+    "upstream_responses_total", "上游回應次數（依狀態碼；連線錯誤為 error）", ("host", "status")
+)
+upstream_hedges = registry.counter(
+    "upstream_hedges_total", "對沖請求次數（started 送出、hedge_won／primary_won 勝出者、skipped_* 因預算不足未送出）",
+    ("host", "outcome")
+)
+upstream_rate_limit_wait = registry.histogram(
+    "upstream_rate_limit_wait_seconds", "等待全域上游速率預算的時間"
+)
+semaphore_wait = registry.histogram(
+    "semaphore_wait_seconds", "等待並行數限制（semaphore）的時間", ("semaphore",)
+)
+parse_duration = registry.histogram(
+    "parse_duration_seconds", "整頁解析時間（含排入解析執行池的等待）", ("function",), PARSE_BUCKETS
+)
+extractor_duration = registry.histogram(
+    "extractor_duration_seconds", "各擷取函式的執行時間（在解析行程內量測）", ("extractor",), PARSE_BUCKETS
+)
+
+
+# 擷取函式計時：只有在 collect_extractor_timings 之內呼叫時才記錄，其餘（例如基準測試）不增加任何成本
+_timings = threading.local()
+
+
+def timed_extractor(func: Callable) -> Callable:
+    name = func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        pending = getattr(_timings, "pending", None)
+        if pending is None:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            pending.append((name, time.perf_counter() - start))
+    return wrapper
+
+
+def collect_extractor_timings(func: Callable, *args):
+    # 在解析行程（或執行緒）內執行，連同各擷取函式的耗時一起回傳給主行程
+    _timings.pending = []
+    try:
+        result = func(*args)
+        return result, _timings.pending
+    finally:
+        _timings.pending = None
+
+
+def record_extractor_timings(timings: Iterable[Tuple[str, float]]) -> None:
+    for name, seconds in timings:
+        extractor_duration.observe(seconds, name)
+
+
+# 純 ASGI 中介層：以路由樣板（而非實際路徑）為標籤，避免標籤數量隨書籍 ID 無限成長
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - start, scope["method"], getattr(route, "path", "unmatched"), str(status)
+            )
@@ -0,0 +1,251 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import List, Optional
+
+import httpx
+
+from http_client import fetch
+from rate_limit import PrefetchDeferred, UpstreamUnavailable
+
+# 上游原始頁面的本機持久化儲存（SQLite），重新啟動後可直接由磁碟提供服務；路徑設為空字串即停用
+PAGE_STORE_PATH = os.getenv("PAGE_STORE_PATH", "page_store.sqlite3")
+# 各類頁面在不重新驗證的情況下可直接使用的秒數
+PAGE_STORE_PRODUCT_MAX_AGE = float(os.getenv("PAGE_STORE_PRODUCT_MAX_AGE", "3600"))
+PAGE_STORE_SEARCH_MAX_AGE = float(os.getenv("PAGE_STORE_SEARCH_MAX_AGE", "600"))
+PAGE_STORE_RANK_MAX_AGE = float(os.getenv("PAGE_STORE_RANK_MAX_AGE", "1800"))
+# 上游無法使用時，仍可回傳的舊頁面最長保留秒數；超過此時間的頁面於啟動時及定期清除
+PAGE_STORE_RETENTION = float(os.getenv("PAGE_STORE_RETENTION", str(7 * 86400)))
+# 最多保留的頁面數，超過時由最久未更新的開始清除（設為 0 即不限制）
+PAGE_STORE_MAX_PAGES = int(os.getenv("PAGE_STORE_MAX_PAGES", "50000"))
+# 背景清除的週期（秒），設為 0 即只在啟動時清除
+PAGE_STORE_PRUNE_INTERVAL = float(os.getenv("PAGE_STORE_PRUNE_INTERVAL", "3600"))
+
+
+class StoredPage:
+    __slots__ = ("url", "body", "fetched_at", "etag", "last_modified", "content_hash")
+
+    def __init__(self, url: str, body: str, fetched_at: float, etag: Optional[str],
+                 last_modified: Optional[str], content_hash: str):
+        self.url = url
+        self.body = body
+        self.fetched_at = fetched_at
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+def _content_hash(body: bytes) -> str:
+    return hashlib.sha1(body).hexdigest()
+
+
+class PageStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " url TEXT PRIMARY KEY,"
+            " body BLOB NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " content_hash TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_fetched_at ON pages (fetched_at)")
+        self._conn.commit()
+        self.hits = 0
+        self.revalidated = 0
+        self.stale_served = 0
+        self.writes = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def get(self, url: str) -> Optional[StoredPage]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, fetched_at, etag, last_modified, content_hash FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        body, fetched_at, etag, last_modified, content_hash = row
+        return StoredPage(url, zlib.decompress(body).decode("utf-8"), fetched_at, etag, last_modified, content_hash)
+
+    def put(self, url: str, body: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        raw = body.encode("utf-8")
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, body, fetched_at, etag, last_modified, content_hash)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (url, zlib.compress(raw, 6), time.time(), etag, last_modified, _content_hash(raw))
+            )
+            self._conn.commit()
+        self.writes += 1
+
+    def touch(self, url: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+
+    def refresh(self, url: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        # 內容未變但上游換了驗證資訊：更新 ETag／Last-Modified，之後的條件式請求才能得到 304
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pages SET fetched_at = ?, etag = ?, last_modified = ? WHERE url = ?",
+                (time.time(), etag, last_modified, url)
+            )
+            self._conn.commit()
+
+    def prune(self, retention: float, max_pages: int = 0) -> int:
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM pages WHERE fetched_at < ?", (time.time() - retention,)).rowcount
+            if max_pages > 0:
+                removed += self._conn.execute(
+                    "DELETE FROM pages WHERE url IN"
+                    " (SELECT url FROM pages ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)", (max_pages,)
+                ).rowcount
+            self._conn.commit()
+        return removed
+
+    def list_urls(self, limit: int) -> List[str]:
+        # 由新到舊列出已儲存頁面的 URL
+        with self._lock:
+            rows = self._conn.execute("SELECT url FROM pages ORDER BY fetched_at DESC LIMIT ?", (limit,)).fetchall()
+        return [url for url, in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM pages").fetchone()
+        return {
+            "path": self.path,
+            "pages": count,
+            "max_pages": PAGE_STORE_MAX_PAGES,
+            "bytes": size,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "stale_served": self.stale_served,
+            "writes": self.writes,
+        }
+
+
+_store: Optional[PageStore] = None
+
+
+def init_page_store() -> Optional[PageStore]:
+    global _store
+    if _store is None and PAGE_STORE_PATH:
+        _store = PageStore(PAGE_STORE_PATH)
+        removed = _store.prune(PAGE_STORE_RETENTION, PAGE_STORE_MAX_PAGES)
+        if removed:
+            print(f"已清除 {removed} 筆過期的本機頁面")
+    return _store
+
+
+async def run_page_store_pruner(store: PageStore, interval: float = PAGE_STORE_PRUNE_INTERVAL) -> None:
+    # 長時間執行時定期清除過期頁面並維持頁面數上限，避免資料庫無限成長
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed = await asyncio.to_thread(store.prune, PAGE_STORE_RETENTION, PAGE_STORE_MAX_PAGES)
+        except sqlite3.Error as e:
+            print(f"清除本機頁面失敗: {str(e)}")
+            continue
+        if removed:
+            print(f"已清除 {removed} 筆過期的本機頁面")
+
+
+def close_page_store() -> None:
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
+
+
+def get_page_store() -> Optional[PageStore]:
+    return init_page_store()
+
+
+def _stored_response(page: StoredPage, stale: bool = False) -> httpx.Response:
+    return httpx.Response(
+        200,
+        content=page.body.encode("utf-8"),
+        headers={"content-type": "text/html; charset=utf-8"},
+        request=httpx.Request("GET", page.url),
+        extensions={"page_store_stale": stale, "page_store_fetched_at": page.fetched_at},
+    )
+
+
+def is_stale_fallback(response: httpx.Response) -> bool:
+    # 上游無法使用時頂替的舊頁面：內容可能已過期數天，呼叫端不應放進快取或當成新鮮資料回應
+    return response.extensions.get("page_store_stale", False)
+
+
+def page_fetched_at(response: httpx.Response) -> float:
+    # 頁面內容的抓取時間：來自本機儲存的為存入（或最後驗證）時間，直接向上游抓取的為現在
+    return response.extensions.get("page_store_fetched_at", time.time())
+
+
+async def fetch_page(url: str, headers: Optional[dict] = None, max_age: float = PAGE_STORE_PRODUCT_MAX_AGE) -> httpx.Response:
+    # 新鮮的本機頁面直接回傳；過期則以 ETag／Last-Modified 做條件式請求，304 時沿用本機內容
+    store = get_page_store()
+    if store is None:
+        return await fetch(url, headers=headers)
+
+    stored = await asyncio.to_thread(store.get, url)
+    if stored is not None and stored.age < max_age:
+        store.hits += 1
+        return _stored_response(stored)
+
+    request_headers = dict(headers or {})
+    if stored is not None:
+        if stored.etag:
+            request_headers["If-None-Match"] = stored.etag
+        if stored.last_modified:
+            request_headers["If-Modified-Since"] = stored.last_modified
+
+    try:
+        response = await fetch(url, headers=request_headers)
+    except PrefetchDeferred:
+        # 預取只是讓路給互動請求，不以舊頁面頂替（否則舊內容會被當成預取結果）
+        raise
+    except (UpstreamUnavailable, httpx.TransportError):
+        # 上游無法使用時，以保留期間內的舊頁面頂替
+        if stored is not None:
+            store.stale_served += 1
+            return _stored_response(stored, stale=True)
+        raise
+
+    if response.status_code >= 500 and stored is not None:
+        # 上游暫時錯誤時同樣以舊頁面頂替
+        store.stale_served += 1
+        return _stored_response(stored, stale=True)
+
+    if response.status_code == 304 and stored is not None:
+        store.revalidated += 1
+        await asyncio.to_thread(store.touch, url)
+        stored.fetched_at = time.time()
+        return _stored_response(stored)
+
+    if response.status_code == 200:
+        if stored is not None and stored.content_hash == _content_hash(response.text.encode("utf-8")):
+            await asyncio.to_thread(
+                store.refresh, url, response.headers.get("etag"), response.headers.get("last-modified")
+            )
+        else:
+            await asyncio.to_thread(
+                store.put, url, response.text, response.headers.get("etag"), response.headers.get("last-modified")
+            )
+    return response
@@ -0,0 +1,68 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from metrics import collect_extractor_timings, parse_duration, record_extractor_timings
+from server_timing import add_timing
+
+# 解析工作的執行方式：process（多核心）、thread（適用會釋放 GIL 的解析引擎）、inline（直接在事件迴圈上執行）
+PARSE_EXECUTOR = os.getenv("PARSE_EXECUTOR", "process")
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 2)))
+
+# 子行程的啟動方式：執行池建立時事件迴圈與 to_thread 的執行緒已存在，fork 會繼承其他執行緒持有的鎖而可能死結
+PARSE_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+_executor: Optional[Executor] = None
+
+
+def create_parse_executor(kind: str = PARSE_EXECUTOR, workers: int = PARSE_WORKERS) -> Optional[Executor]:
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(PARSE_START_METHOD))
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="parse")
+    if kind != "inline":
+        print(f"⚠ 不支援的 PARSE_EXECUTOR={kind}，改在事件迴圈上直接解析")
+    return None
+
+
+def init_parse_executor() -> Optional[Executor]:
+    global _executor
+    if _executor is None:
+        _executor = create_parse_executor()
+    return _executor
+
+
+def shutdown_parse_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def run_parse(func: Callable, *args: Any) -> Any:
+    # 解析函式與參數須可 pickle（模組層級函式或 AsyncBookSearcher 的方法）
+    # 各擷取函式的耗時在解析端量測後隨結果帶回，於主行程記錄成指標
+    start = time.perf_counter()
+    executor = init_parse_executor()
+    if executor is None:
+        result, timings = collect_extractor_timings(func, *args)
+    else:
+        loop = asyncio.get_running_loop()
+        try:
+            result, timings = await loop.run_in_executor(executor, collect_extractor_timings, func, *args)
+        except BrokenProcessPool:
+            # 子行程異常結束時重建執行池，這次先在事件迴圈上解析
+            print("⚠ 解析行程池已損壞，重新建立")
+            shutdown_parse_executor()
+            result, timings = collect_extractor_timings(func, *args)
+    elapsed = time.perf_counter() - start
+    parse_duration.observe(elapsed, func.__name__)
+    add_timing("parse", elapsed)
+    record_extractor_timings(timings)
+    for name, seconds in timings:
+        add_timing(f"parse.{name}", seconds)
+    return result
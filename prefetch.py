@@ -0,0 +1,145 @@
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from rate_limit import (
+    PREFETCH_TOKEN_RESERVE, PRIORITY_PREFETCH, PrefetchDeferred, UpstreamUnavailable, fetch_priority,
+    upstream_breaker, upstream_limiter
+)
+
+# 搜尋／排行榜回應後，背景預取前幾筆書籍詳細資料的筆數（設為 0 即停用）
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", "5"))
+# 待預取佇列上限（滿了就丟掉最舊的）與同時預取數
+PREFETCH_QUEUE_SIZE = int(os.getenv("PREFETCH_QUEUE_SIZE", "100"))
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))
+# 忙碌時暫停的秒數
+PREFETCH_BACKOFF = float(os.getenv("PREFETCH_BACKOFF", "1"))
+
+
+# 低優先權的書籍詳細資料預取：只在互動請求沒有排隊時才向上游抓取，忙碌時清空佇列並讓路，
+# 預算暫時不足時放回佇列等待補充；
+# 已送出的上游請求會完成（速率預算已消耗），結果照常寫入快取
+class Prefetcher:
+    def __init__(self, loader: Callable[[str], Awaitable[Any]], is_cached: Callable[[str], bool],
+                 top_n: int = PREFETCH_TOP_N, max_queue: int = PREFETCH_QUEUE_SIZE,
+                 concurrency: int = PREFETCH_CONCURRENCY):
+        self.loader = loader
+        self.is_cached = is_cached
+        self.top_n = top_n
+        self.max_queue = max_queue
+        self.concurrency = concurrency
+        self._queue: "OrderedDict[str, None]" = OrderedDict()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self.enqueued = 0
+        self.dropped = 0
+        self.skipped_cached = 0
+        self.completed = 0
+        self.failed = 0
+        self.deferred = 0
+        self.cancelled = 0
+
+    def enqueue(self, book_ids: Iterable[Optional[str]]) -> None:
+        if not self._workers:
+            return
+        added = 0
+        for book_id in book_ids:
+            if added >= self.top_n:
+                break
+            if not book_id:
+                continue
+            added += 1
+            if book_id in self._queue or self.is_cached(book_id):
+                continue
+            self._queue[book_id] = None
+            self.enqueued += 1
+            if len(self._queue) > self.max_queue:
+                # 新的搜尋結果比較可能被點選，丟掉最舊的
+                self._queue.popitem(last=False)
+                self.dropped += 1
+        if self._queue:
+            self._wakeup.set()
+
+    def under_load(self) -> bool:
+        # 有互動請求在等待速率預算，或斷路器未關閉
+        return upstream_limiter.waiting > 0 or upstream_breaker.state != upstream_breaker.CLOSED
+
+    def _drop_queue(self) -> None:
+        self.cancelled += len(self._queue)
+        self._queue.clear()
+
+    def _requeue(self, book_id: str) -> None:
+        # 放回佇列最前面，預算補充後優先處理
+        if book_id not in self._queue and len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._queue[book_id] = None
+        self._queue.move_to_end(book_id, last=False)
+
+    async def _prefetch(self, book_id: str) -> None:
+        token = fetch_priority.set(PRIORITY_PREFETCH)
+        try:
+            await self.loader(book_id)
+            self.completed += 1
+        except PrefetchDeferred:
+            # 送出前發現預算要留給互動請求：放回佇列，等 token 補充到保留量以上再試
+            self.deferred += 1
+            self._requeue(book_id)
+            wait = upstream_limiter.time_until_available(PREFETCH_TOKEN_RESERVE)
+            await asyncio.sleep(wait if wait > 0 else PREFETCH_BACKOFF)
+        except UpstreamUnavailable:
+            # 斷路器開啟等情況由 run() 的 under_load() 檢查清空佇列
+            self.failed += 1
+        except Exception as e:
+            print(f"背景預取失敗 {book_id}: {str(e)}")
+            self.failed += 1
+        finally:
+            fetch_priority.reset(token)
+
+    async def run(self) -> None:
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if self.under_load():
+                self._drop_queue()
+                await asyncio.sleep(PREFETCH_BACKOFF)
+                continue
+            book_id, _ = self._queue.popitem(last=False)
+            if self.is_cached(book_id):
+                self.skipped_cached += 1
+                continue
+            await self._prefetch(book_id)
+
+    def start(self) -> None:
+        if self.top_n > 0 and self.concurrency > 0 and not self._workers:
+            self._wakeup = asyncio.Event()
+            self._workers = [asyncio.create_task(self.run()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        for worker in self._workers:
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+        self._queue.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": bool(self._workers),
+            "queued": len(self._queue),
+            "max_queue": self.max_queue,
+            "top_n": self.top_n,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "skipped_cached": self.skipped_cached,
+            "completed": self.completed,
+            "failed": self.failed,
+            "deferred": self.deferred,
+            "cancelled": self.cancelled,
+        }
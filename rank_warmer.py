@@ -0,0 +1,132 @@
+import asyncio
+import os
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from book_searcher import AsyncBookSearcher, RANK_BOOK_TYPES, RANK_TYPES
+from local_index import local_index
+from rate_limit import UpstreamUnavailable
+
+# 背景更新所有排行榜的週期（秒），設為 0 即停用
+RANK_WARM_INTERVAL = float(os.getenv("RANK_WARM_INTERVAL", "3600"))
+# 記憶體內的排行榜超過此秒數未更新就視為失效，改回即時抓取
+RANK_WARM_MAX_AGE = float(os.getenv("RANK_WARM_MAX_AGE", str(6 * 3600)))
+# 啟動後第一輪預熱每個排行榜之間的間隔（秒），讓記憶體盡快填滿
+RANK_WARM_INITIAL_SPACING = float(os.getenv("RANK_WARM_INITIAL_SPACING", "2"))
+
+
+# 定期錯開時間更新每個排行榜組合，端點直接從記憶體回傳，冷門組合未命中時才即時抓取
+class RankWarmer:
+    def __init__(self, searcher: AsyncBookSearcher, interval: float = RANK_WARM_INTERVAL,
+                 max_age: float = RANK_WARM_MAX_AGE):
+        self.searcher = searcher
+        self.interval = interval
+        self.max_age = max_age
+        self._ranks: Dict[str, Tuple[float, List[dict]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def rank_urls(self) -> List[str]:
+        # 只有暢銷榜依分類與 7／30 天區分，其餘排行榜的 URL 相同，以 URL 去重
+        urls = []
+        for rank_type in RANK_TYPES:
+            for book_type in RANK_BOOK_TYPES:
+                for is_weekly in (False, True):
+                    url = self.searcher.rank_url(rank_type, book_type, is_weekly)
+                    if url and url not in urls:
+                        urls.append(url)
+        return urls
+
+    def get(self, rank_type: int, book_type: str, is_weekly: bool) -> Optional[List[dict]]:
+        url = self.searcher.rank_url(rank_type, book_type, is_weekly)
+        entry = self._ranks.get(url) if url else None
+        if entry is None or time.monotonic() - entry[0] > self.max_age:
+            return None
+        return entry[1]
+
+    def remaining_ttl(self, rank_type: int, book_type: str, is_weekly: bool) -> float:
+        # 距離下一次背景更新還有幾秒；未啟用預熱時以 max_age 為新鮮期
+        url = self.searcher.rank_url(rank_type, book_type, is_weekly)
+        entry = self._ranks.get(url) if url else None
+        if entry is None:
+            return 0.0
+        fresh_for = self.interval if self.interval > 0 else self.max_age
+        return max(0.0, fresh_for - (time.monotonic() - entry[0]))
+
+    async def get_rank(self, rank_type: int, book_type: str, is_weekly: bool):
+        books = self.get(rank_type, book_type, is_weekly)
+        if books is not None:
+            self.hits += 1
+            return books
+        self.misses += 1
+        url = self.searcher.rank_url(rank_type, book_type, is_weekly)
+        if not url:
+            return await self.searcher.book_rank(rank_type, book_type, is_weekly)
+        result = await self.searcher.load_book_rank(url)
+        if 'error' in result:
+            return result
+        # 上游無法使用時頂替的舊頁面不記入記憶體，remaining_ttl 因此為 0
+        if not result['stale']:
+            self._ranks[url] = (time.monotonic(), result['books'])
+            local_index.add_rank_books(result['books'])
+        return result['books']
+
+    async def refresh(self, url: str) -> bool:
+        try:
+            result = await self.searcher.load_book_rank(url)
+        except UpstreamUnavailable as e:
+            print(f"⚠ 排行榜預熱暫停：{str(e)}")
+            self.refresh_failures += 1
+            return False
+        except Exception as e:
+            print(f"排行榜預熱失敗 {url}: {str(e)}")
+            self.refresh_failures += 1
+            return False
+        if 'error' in result or result['stale']:
+            self.refresh_failures += 1
+            return False
+        self._ranks[url] = (time.monotonic(), result['books'])
+        local_index.add_rank_books(result['books'])
+        self.refreshes += 1
+        return True
+
+    async def run(self) -> None:
+        # 每一輪把所有排行榜平均分散在 interval 內，並加入少量抖動，避免同時對上游發出大量請求
+        first_round = True
+        while True:
+            urls = self.rank_urls()
+            spacing = self.interval / len(urls)
+            if first_round:
+                spacing = min(spacing, RANK_WARM_INITIAL_SPACING)
+                first_round = False
+            for url in urls:
+                await self.refresh(url)
+                await asyncio.sleep(spacing * random.uniform(0.9, 1.1))
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "ranks": len(self._ranks),
+            "combinations": len(self.rank_urls()),
+            "interval": self.interval,
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+        }
@@ -0,0 +1,184 @@
+import asyncio
+import os
+import random
+import time
+from contextvars import ContextVar
+from typing import Dict
+
+# 全程序共用的上游請求預算：每秒補充的 token 數與可累積的突發量
+UPSTREAM_RATE = float(os.getenv("UPSTREAM_RATE", "5"))
+UPSTREAM_BURST = int(os.getenv("UPSTREAM_BURST", "10"))
+# 排隊等待 token 超過此秒數就直接拒絕，避免請求堆積到逾時
+UPSTREAM_MAX_WAIT = float(os.getenv("UPSTREAM_MAX_WAIT", "5"))
+# 背景預取不可動用的保留 token 數：留給互動請求的突發量
+PREFETCH_TOKEN_RESERVE = float(os.getenv("PREFETCH_TOKEN_RESERVE", "5"))
+
+# 斷路器：連續幾次被封鎖訊號（403/429/驗證頁/逾時）後開路，以及退避時間
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_BASE_BACKOFF = float(os.getenv("BREAKER_BASE_BACKOFF", "30"))
+BREAKER_MAX_BACKOFF = float(os.getenv("BREAKER_MAX_BACKOFF", "900"))
+
+BAN_STATUS_CODES = (403, 429)
+# 上游回傳 200 但實際是驗證／封鎖頁面時常見的字樣
+CHALLENGE_MARKERS = ("captcha", "cf-chl", "Access Denied", "Request unsuccessful", "異常流量")
+CHALLENGE_MAX_BYTES = 20000
+
+
+class UpstreamUnavailable(Exception):
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# 背景預取讓路給互動請求而放棄的上游請求
+class PrefetchDeferred(UpstreamUnavailable):
+    pass
+
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_PREFETCH = "prefetch"
+# 目前上游請求的優先權：互動請求依序等待速率預算；背景預取只在沒有互動請求排隊、且扣除保留量仍有 token 時才送出，
+# 否則拋出 PrefetchDeferred，不會排在互動請求前面
+fetch_priority: ContextVar[str] = ContextVar("fetch_priority", default=PRIORITY_INTERACTIVE)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int, max_wait: float):
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self.acquired = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.waiting = 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        # 先預約 token（餘額可為負），再睡到輪到自己；預計等待超過 max_wait 時直接拒絕
+        self._refill(time.monotonic())
+        wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+        if wait > self.max_wait:
+            self.rejected += 1
+            raise UpstreamUnavailable("上游請求已達速率上限，請稍後再試", retry_after=wait)
+        self._tokens -= 1
+        self.acquired += 1
+        self.wait_seconds += wait
+        if wait > 0:
+            self.waiting += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self.waiting -= 1
+        return wait
+
+    def try_acquire(self, reserve: float = 0.0) -> bool:
+        # 不等待：沒有請求在排隊、且扣除 reserve 後仍有完整 token 才取用（用於對沖、預取等可有可無的額外請求）
+        self._refill(time.monotonic())
+        if self.waiting or self._tokens < 1 + reserve:
+            return False
+        self._tokens -= 1
+        self.acquired += 1
+        return True
+
+    def time_until_available(self, reserve: float = 0.0) -> float:
+        # 距離扣除 reserve 後仍有完整 token 還需要的秒數
+        self._refill(time.monotonic())
+        return max(0.0, (1 + reserve - self._tokens) / self.rate)
+
+    def stats(self) -> Dict[str, float]:
+        self._refill(time.monotonic())
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "tokens": round(self._tokens, 2),
+            "acquired": self.acquired,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "wait_seconds": round(self.wait_seconds, 3),
+        }
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, base_backoff: float, max_backoff: float):
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opens = 0
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self.shed = 0
+        self.trips = 0
+
+    def before_request(self) -> None:
+        # 開路期間直接拒絕；退避結束後只放行一個探測請求
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now < self._open_until:
+                self.shed += 1
+                raise UpstreamUnavailable("上游暫時封鎖中，請稍後再試", retry_after=self._open_until - now)
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.shed += 1
+                raise UpstreamUnavailable("上游恢復確認中，請稍後再試", retry_after=1.0)
+            self._probe_in_flight = True
+
+    def release_probe(self) -> None:
+        # 請求在送出前就結束（例如被速率限制拒絕或取消），不影響斷路器狀態
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        self._probe_in_flight = False
+        self._failures = 0
+        self._opens = 0
+        self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        self._probe_in_flight = False
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._trip()
+
+    def _trip(self) -> None:
+        self._opens += 1
+        self.trips += 1
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** (self._opens - 1))
+        # 加入隨機抖動，避免多個行程同時恢復請求
+        backoff *= random.uniform(0.8, 1.2)
+        self._open_until = time.monotonic() + backoff
+        self._failures = 0
+        self.state = self.OPEN
+        print(f"⚠ 偵測到上游封鎖，暫停上游請求 {backoff:.0f} 秒")
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "retry_after": round(max(0.0, self._open_until - time.monotonic()), 1) if self.state == self.OPEN else 0.0,
+            "trips": self.trips,
+            "shed": self.shed,
+        }
+
+
+def is_ban_response(response) -> bool:
+    if response.status_code in BAN_STATUS_CODES:
+        return True
+    # 只檢查小型回應：驗證頁面通常很短，一般商品／搜尋頁不需額外解碼
+    if response.status_code == 200 and len(response.content) < CHALLENGE_MAX_BYTES:
+        return any(marker in response.text for marker in CHALLENGE_MARKERS)
+    return False
+
+
+upstream_limiter = TokenBucket(UPSTREAM_RATE, UPSTREAM_BURST, UPSTREAM_MAX_WAIT)
+upstream_breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_BASE_BACKOFF, BREAKER_MAX_BACKOFF)
@@ -0,0 +1,132 @@
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+from urllib.parse import parse_qs
+
+# 設定後才允許 ?profile=1（需帶 X-Profile-Token 標頭），未設定即停用
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+# 分析結果列出的函式數
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "40"))
+
+# 目前請求的各階段耗時（秒）；由請求建立的子任務會共用同一個 dict
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def add_timing(name: str, seconds: float) -> None:
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timing(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(name, time.perf_counter() - start)
+
+
+def format_server_timing(timings: Dict[str, float], total: float) -> str:
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def _profile_requested(scope) -> bool:
+    return parse_qs(scope.get("query_string", b"").decode("latin-1")).get("profile") == ["1"]
+
+
+def _profile_authorized(scope) -> bool:
+    if not PROFILE_TOKEN:
+        return False
+    token = dict(scope["headers"]).get(b"x-profile-token", b"").decode("latin-1")
+    return hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+async def _send_text(send, status: int, text: str, headers=()) -> None:
+    body = text.encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"text/plain; charset=utf-8"), (b"content-length", str(len(body)).encode())]
+                   + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+# 每個回應加上 Server-Timing 標頭（upstream、parse、model、serialize 與各擷取函式）；
+# 串流回應的標頭在第一筆資料前送出，只包含當下已累計的時間
+class ServerTimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._profiling = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if _profile_requested(scope):
+            await self._profile(scope, receive, send)
+            return
+
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                header = format_server_timing(timings, time.perf_counter() - start)
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", header.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+
+    async def _profile(self, scope, receive, send):
+        # 以 cProfile 記錄整個請求期間事件迴圈執行緒上的所有呼叫，改回傳依累計時間排序的呼叫統計。
+        # cProfile 是確定性的（非取樣）分析器，會拖慢請求；同時間執行的其他請求也會被記錄在內，
+        # 在 PARSE_EXECUTOR=process 下 HTML 解析在其他行程，需改用 inline 才看得到擷取函式。
+        if not _profile_authorized(scope):
+            await _send_text(send, 403, "需要有效的 X-Profile-Token 才能使用 profile=1\n")
+            return
+        if self._profiling:
+            await _send_text(send, 409, "已有請求正在分析，請稍後再試\n")
+            return
+
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        status = 500
+
+        async def discard(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        self._profiling = True
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            profiler.disable()
+            self._profiling = False
+            _request_timings.reset(token)
+        total = time.perf_counter() - start
+
+        output = io.StringIO()
+        output.write(f"原始回應狀態：{status}\nServer-Timing：{format_server_timing(timings, total)}\n\n")
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+        stats.print_callees(PROFILE_TOP)
+        await _send_text(send, 200, output.getvalue(),
+                         [(b"server-timing", format_server_timing(timings, total).encode())])
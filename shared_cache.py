@@ -0,0 +1,225 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from json_response import dumps, loads
+
+# 多個 uvicorn worker 共用的解析結果快取（SQLite＋mmap），同一台主機上的行程共用同一個檔案；路徑設為空字串即停用
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "")
+SHARED_CACHE_MMAP_SIZE = int(os.getenv("SHARED_CACHE_MMAP_SIZE", str(64 * 1024 * 1024)))
+# 其他 worker 正在抓取同一個 key 時，最多等待的秒數（也是租約的有效期限）與輪詢間隔
+SHARED_CACHE_LEASE_TTL = float(os.getenv("SHARED_CACHE_LEASE_TTL", "15"))
+SHARED_CACHE_POLL_INTERVAL = float(os.getenv("SHARED_CACHE_POLL_INTERVAL", "0.1"))
+# 背景清除過期項目與租約的週期（秒），設為 0 即只在啟動時清除
+SHARED_CACHE_PRUNE_INTERVAL = float(os.getenv("SHARED_CACHE_PRUNE_INTERVAL", "300"))
+
+# 本行程的租約持有者 ID
+_OWNER = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_MISS = object()
+
+
+class SharedCache:
+    def __init__(self, path: str, mmap_size: int = SHARED_CACHE_MMAP_SIZE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        # 進行中抓取的租約：同一個 key 同時只有一個 worker 向上游抓取
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            " key TEXT PRIMARY KEY,"
+            " owner TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.polls = 0
+        self.wait_hits = 0
+        self.lease_timeouts = 0
+        self.writes = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM entries WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        if row is None:
+            return _MISS
+        return loads(row[0])
+
+    def peek(self, key: str) -> Tuple[Any, bool]:
+        # 只讀取：回傳 (快取值或 _MISS, 是否有其他 worker 持有未過期的租約)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM entries WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            leased = row is None and self._conn.execute(
+                "SELECT 1 FROM leases WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone() is not None
+        if row is None:
+            return _MISS, leased
+        return loads(row[0]), False
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        body = dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, body, time.time() + ttl)
+            )
+            self._conn.commit()
+        self.writes += 1
+
+    def try_lease(self, key: str, ttl: float) -> bool:
+        # 沒有租約或租約已過期（持有的 worker 當掉）時才能取得
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at"
+                " WHERE leases.expires_at <= ?",
+                (key, _OWNER, now + ttl, now)
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, _OWNER))
+            self._conn.commit()
+
+    def prune(self) -> int:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+            self._conn.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM entries"
+            ).fetchone()
+            leases, = self._conn.execute("SELECT COUNT(*) FROM leases").fetchone()
+        return {
+            "path": self.path,
+            "entries": count,
+            "bytes": size,
+            "leases": leases,
+            "hits": self.hits,
+            "misses": self.misses,
+            "polls": self.polls,
+            "wait_hits": self.wait_hits,
+            "lease_timeouts": self.lease_timeouts,
+            "writes": self.writes,
+        }
+
+
+_shared: Optional[SharedCache] = None
+
+
+def init_shared_cache() -> Optional[SharedCache]:
+    global _shared
+    if _shared is None and SHARED_CACHE_PATH:
+        _shared = SharedCache(SHARED_CACHE_PATH)
+        _shared.prune()
+    return _shared
+
+
+async def run_shared_cache_pruner(shared: SharedCache, interval: float = SHARED_CACHE_PRUNE_INTERVAL) -> None:
+    # 長時間執行時定期清除過期項目，避免共用快取檔案無限成長
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(shared.prune)
+        except sqlite3.Error as e:
+            print(f"清除共用快取失敗: {str(e)}")
+
+
+def close_shared_cache() -> None:
+    global _shared
+    if _shared is not None:
+        _shared.close()
+        _shared = None
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    return init_shared_cache()
+
+
+async def shared_get(key: str) -> Any:
+    # 只查詢跨行程快取，未啟用或未命中時回傳 None
+    shared = get_shared_cache()
+    if shared is None:
+        return None
+    value = await asyncio.to_thread(shared.get, key)
+    return None if value is _MISS else value
+
+
+def _cacheable(value: Any) -> bool:
+    return value is not None
+
+
+async def shared_load(key: str, loader: Callable[[], Awaitable[Any]], ttl: float,
+                      cacheable: Callable[[Any], bool] = _cacheable) -> Any:
+    # 先查跨行程快取；未命中時取得租約的 worker 負責抓取並寫回，其他 worker 輪詢等待結果
+    # 值以 JSON 儲存，tuple 讀回後會變成 list
+    shared = get_shared_cache()
+    if shared is None:
+        return await loader()
+
+    value = await asyncio.to_thread(shared.get, key)
+    if value is not _MISS:
+        shared.hits += 1
+        return value
+    shared.misses += 1
+
+    deadline = time.monotonic() + SHARED_CACHE_LEASE_TTL
+    while not await asyncio.to_thread(shared.try_lease, key, SHARED_CACHE_LEASE_TTL):
+        # 輪詢時只做讀取，租約已釋放或過期時才再以寫入交易競爭租約
+        while True:
+            shared.polls += 1
+            await asyncio.sleep(SHARED_CACHE_POLL_INTERVAL)
+            value, leased = await asyncio.to_thread(shared.peek, key)
+            if value is not _MISS:
+                shared.wait_hits += 1
+                return value
+            if time.monotonic() >= deadline:
+                # 持有租約的 worker 太久沒有結果，改由自己抓取
+                shared.lease_timeouts += 1
+                return await loader()
+            if not leased:
+                # 前一個持有者沒有寫入結果就釋放（例如抓取失敗）或已過期
+                break
+
+    try:
+        # 取得租約前，前一個持有者可能剛好寫入結果
+        value = await asyncio.to_thread(shared.get, key)
+        if value is not _MISS:
+            shared.wait_hits += 1
+            return value
+        value = await loader()
+        if cacheable(value):
+            await asyncio.to_thread(shared.set, key, value, ttl)
+        return value
+    finally:
+        await asyncio.to_thread(shared.release, key)
@@ -0,0 +1,45 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from rate_limit import PRIORITY_PREFETCH, PrefetchDeferred, fetch_priority
+
+
+# 同一個 key 同時只會有一個進行中的抓取＋解析，其他呼叫者共用同一份結果
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.leaders += 1
+        else:
+            self.shared += 1
+        # shield：單一呼叫者被取消時，不影響其他等待同一結果的呼叫者
+        try:
+            return await asyncio.shield(task)
+        except PrefetchDeferred:
+            # 加入的是讓路給互動請求而放棄的背景預取：互動請求改以自己的優先權重新抓取
+            if fetch_priority.get() == PRIORITY_PREFETCH:
+                raise
+            return await self.do(key, fn)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "shared": self.shared,
+        }
+
+
+# 所有上游抓取共用的進行中請求表
+upstream_flight = SingleFlight()